@@ -0,0 +1,521 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from chatbot import (IntentMatcher, build_default_matcher, TranscriptModel, TranscriptView,
+                     ContentStore, safe_read_lines, append_line_to_file, RiddleBank, FactIndex, ChatbotCore,
+                     ThemeEngine, THEMES)
+from chat_server import ShardedCore
+
+MB = 1024 * 1024
+READ_SIZES = (1 * MB, 100 * MB, 1024 * MB)
+QUICK_READ_SIZES = (1 * MB, 10 * MB)
+REGRESSION_THRESHOLD = 0.10   # --compare flags results that got this much worse
+
+# name -> {"value": ..., "unit": ...}, filled by _record and saved with --json
+RESULTS = {}
+
+# ---------------------------
+# Helpers
+# ---------------------------
+def _random_word(rng, lo=4, hi=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(lo, hi)))
+
+@contextmanager
+def _in_tempdir():
+    # ChatbotCore creates its content files in the working directory
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+def _time_per_call(func, inputs, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in inputs:
+            func(item)
+        elapsed = (time.perf_counter() - start) / len(inputs)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _record(name, value, unit):
+    # units ending in /s are throughputs (higher is better), the rest are costs
+    RESULTS[name.strip()] = {"value": value, "unit": unit}
+    print(f"{name:<40} {value:10.2f} {unit}")
+
+def _report(name, seconds_per_call):
+    _record(name, seconds_per_call * 1e6, "us/msg")
+
+# ---------------------------
+# Intent matcher
+# ---------------------------
+def bench_matcher(sizes=(10, 1000, 100000), messages=2000, seed=1234):
+    rng = random.Random(seed)
+    sample = [" ".join(_random_word(rng) for _ in range(rng.randint(3, 12))) for _ in range(messages)]
+    for n in sizes:
+        matcher = IntentMatcher()
+        for i in range(n):
+            if i % 2:
+                matcher.add_exact(_random_word(rng, 6, 14), "convo", i)
+            else:
+                matcher.add_keyword(_random_word(rng, 6, 14), "convo", i)
+        start = time.perf_counter()
+        matcher.compile()
+        build = time.perf_counter() - start
+        _record(f"matcher build @ {n} intents", build * 1000, "ms")
+        _report(f"  match() @ {n} intents", _time_per_call(matcher.match, sample))
+
+    default = build_default_matcher()
+    convo = ["hello", "how are you", "tell me a joke", "did you know this fact", "riddles", "blah blah"] * (messages // 6)
+    _report("  match() default rules", _time_per_call(default.match, convo))
+
+# ---------------------------
+# Chat transcript
+# ---------------------------
+def _make_root():
+    if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        print("  (no Tk display, widget benchmarks skipped)")
+        return None
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        print(f"  (no Tk display, widget benchmarks skipped: {e})")
+        return None
+    return root
+
+def _make_text_widget():
+    root = _make_root()
+    if root is None:
+        return None, None
+    from tkinter import scrolledtext
+    widget = scrolledtext.ScrolledText(root, wrap="word", state="disabled")
+    widget.pack()
+    return root, widget
+
+def bench_transcript(messages=100000, burst=50):
+    lines = [f"message number {i} " + "lorem ipsum " * (i % 7) for i in range(messages)]
+
+    model = TranscriptModel()
+    start = time.perf_counter()
+    for i, text in enumerate(lines, start=1):
+        model.add(f"Bot [00:00:00]: {text}\n\n")
+        if i % burst == 0:
+            model.flush_pending()
+    model.flush_pending()
+    elapsed = time.perf_counter() - start
+    _record(f"transcript model add @ {messages}", elapsed / messages * 1e6, "us/msg")
+    start = time.perf_counter()
+    while model.can_page_back():
+        model.page_back()
+    _record("transcript model page back all", time.perf_counter() - start, "s")
+    model.clear()
+
+    root, widget = _make_text_widget()
+    if widget is None:
+        return
+    import tkinter as tk
+
+    start = time.perf_counter()
+    for text in lines:
+        widget.configure(state="normal")
+        widget.insert(tk.END, f"Bot [00:00:00]: {text}\n\n")
+        widget.configure(state="disabled")
+        widget.see(tk.END)
+    root.update()
+    _record("transcript widget insert per message", time.perf_counter() - start, "s")
+    widget.configure(state="normal")
+    widget.delete("1.0", tk.END)
+
+    view = TranscriptView(widget)
+    start = time.perf_counter()
+    for i, text in enumerate(lines, start=1):
+        view.add("Bot", text)
+        if i % burst == 0:
+            view.flush()
+    view.flush()
+    root.update()
+    _record("transcript widget batched view", time.perf_counter() - start, "s")
+    root.destroy()
+
+# ---------------------------
+# Theme switching
+# ---------------------------
+def bench_themes(widgets=(100, 1000, 5000), switches=20):
+    root = _make_root()
+    if root is None:
+        return
+    import tkinter as tk
+    from tkinter import ttk
+    names = list(THEMES)
+    for n in widgets:
+        # styled ttk widgets, as the GUI builds them
+        engine = ThemeEngine(root, THEMES)
+        box = ttk.Frame(root, style="Ctrl.TFrame")
+        for i in range(n):
+            kind = i % 3
+            if kind == 0:
+                ttk.Frame(box, style="Ctrl.TFrame", width=10, height=10).grid(row=i // 40, column=i % 40)
+            elif kind == 1:
+                ttk.Label(box, text="label", style="TLabel").grid(row=i // 40, column=i % 40)
+            else:
+                ttk.Button(box, text="button").grid(row=i // 40, column=i % 40)
+        box.pack()
+        root.update_idletasks()
+        start = time.perf_counter()
+        for k in range(switches):
+            engine.apply(names[k % len(names)])
+            root.update_idletasks()
+        _record(f"theme switch, styles @ {n} widgets", (time.perf_counter() - start) / switches * 1000, "ms")
+        box.destroy()
+
+        # the old way: plain tk widgets recoloured by walking the tree
+        box = tk.Frame(root)
+        for i in range(n):
+            widget = tk.Frame(box, width=10, height=10) if i % 2 else tk.Label(box, text="label")
+            widget.grid(row=i // 40, column=i % 40)
+        box.pack()
+        root.update_idletasks()
+
+        def walk(widget, colors):
+            for child in widget.winfo_children():
+                child.configure(bg=colors["ctrl_bg"])
+                walk(child, colors)
+
+        start = time.perf_counter()
+        for k in range(switches):
+            walk(box, THEMES[names[k % len(names)]])
+            root.update_idletasks()
+        _record(f"theme switch, tree walk @ {n} widgets", (time.perf_counter() - start) / switches * 1000, "ms")
+        box.destroy()
+    root.destroy()
+
+# ---------------------------
+# Content appends
+# ---------------------------
+def bench_appender(entries=100000, naive_entries=5000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "naive.txt")
+        start = time.perf_counter()
+        for i in range(naive_entries):
+            append_line_to_file(path, f"entry number {i}")
+        elapsed = time.perf_counter() - start
+        _record("append_line_to_file", elapsed / naive_entries * 1e6, "us/entry")
+
+        store = ContentStore(os.path.join(tmp, "bulk.txt"), ["seed"])
+        start = time.perf_counter()
+        added = store.extend(f"entry number {i}" for i in range(entries))
+        store.flush()
+        elapsed = time.perf_counter() - start
+        _record(f"ContentStore.extend + commit @ {added}", elapsed / entries * 1e6, "us/entry")
+        start = time.perf_counter()
+        dupes = entries - store.extend(f"entry number {i}" for i in range(entries))
+        print(f"  re-import: {dupes} of {entries} duplicates skipped")
+        _record("ContentStore duplicate re-import", (time.perf_counter() - start) / entries * 1e6, "us/entry")
+        store.close()
+
+# ---------------------------
+# Riddle answers
+# ---------------------------
+def bench_riddles(bank_size=5000, checks=20000, seed=7):
+    rng = random.Random(seed)
+    riddles = []
+    for i in range(bank_size):
+        answer = " ".join(_random_word(rng, 4, 9) for _ in range(rng.randint(1, 3)))
+        alts = [_random_word(rng, 4, 9) for _ in range(rng.randint(0, 3))]
+        riddles.append({"q": f"riddle {i}?", "a": answer, "alts": alts})
+    start = time.perf_counter()
+    bank = RiddleBank(riddles)
+    _record(f"riddle bank build @ {bank_size}", (time.perf_counter() - start) * 1000, "ms")
+
+    def _typo(word):
+        i = rng.randrange(len(word))
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+
+    cases = []
+    for _ in range(checks):
+        r = rng.choice(riddles)
+        kind = rng.random()
+        if kind < 0.3:
+            cases.append((r, r["a"]))
+        elif kind < 0.6:
+            cases.append((r, "i think it is " + _typo(r["a"])))
+        else:
+            cases.append((r, " ".join(_random_word(rng) for _ in range(rng.randint(1, 25)))))
+    _report("  check() mixed answers", _time_per_call(lambda c: bank.check(*c), cases))
+    long_answers = [(r, "x" * 2000) for r, _ in cases[:500]]
+    _report("  check() 2000-char answers", _time_per_call(lambda c: bank.check(*c), long_answers))
+
+# ---------------------------
+# Fact retrieval
+# ---------------------------
+def bench_retrieval(facts=1000000, vocab=50000, queries=2000, seed=11):
+    rng = random.Random(seed)
+    words = [_random_word(rng, 3, 10) for _ in range(vocab)]
+    # Zipf-ish vocabulary so postings lengths look like real text
+    cum, total = [], 0.0
+    for i in range(vocab):
+        total += 1.0 / (i + 1) ** 0.8
+        cum.append(total)
+    corpus = [" ".join(rng.choices(words, cum_weights=cum, k=rng.randint(6, 18))) for _ in range(facts)]
+    index = FactIndex()
+    start = time.perf_counter()
+    index.sync(corpus)
+    index.wait()
+    _record(f"fact index build @ {facts}", time.perf_counter() - start, "s")
+    qs = [" ".join(rng.choices(words, cum_weights=cum, k=rng.randint(2, 6))) for _ in range(queries)]
+    _report(f"  search() @ {facts} facts", _time_per_call(index.search, qs))
+    rare = [" ".join(rng.choice(words[vocab // 2:]) for _ in range(3)) for _ in range(queries)]
+    _report(f"  search() rare terms", _time_per_call(index.search, rare))
+    start = time.perf_counter()
+    for i in range(1000):
+        corpus.append(f"freshly added fact number {i}")
+        index.sync(corpus)
+    _record("  fact index sync, 1000 single appends", (time.perf_counter() - start) * 1000, "ms")
+
+# ---------------------------
+# Reply cache
+# ---------------------------
+def bench_reply_cache(distinct=5000, messages=50000, facts=20000, zipf_s=1.1, seed=3):
+    rng = random.Random(seed)
+    # replay a Zipf-distributed message log: a few phrases dominate, with a long tail
+    # of free text that falls through to fact retrieval
+    phrases = ["hello", "how are you", "thanks", "bye", "what can you do"]
+    phrases += [" ".join(_random_word(rng) for _ in range(rng.randint(2, 6))) for _ in range(distinct - len(phrases))]
+    cum, total = [], 0.0
+    for i in range(distinct):
+        total += 1.0 / (i + 1) ** zipf_s
+        cum.append(total)
+    log = rng.choices(phrases, cum_weights=cum, k=messages)
+    corpus = [" ".join(_random_word(rng) for _ in range(rng.randint(6, 14))) for _ in range(facts)]
+
+    with _in_tempdir():
+        for size in (0, 256, 4096):
+            core = ChatbotCore(reply_cache_size=size)
+            core.facts = corpus
+            core.fact_index.sync(corpus)
+            core.fact_index.wait()
+            session = core.session("bench")
+            _report(f"  get_reply() cache size {size}", _time_per_call(lambda m: core.get_reply(m, session), log, repeat=1))
+            stats = core.reply_cache.stats()
+            print(f"    hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+            core.close()
+
+# ---------------------------
+# Replies per intent
+# ---------------------------
+def bench_replies(messages=20000, facts=20000, seed=5):
+    rng = random.Random(seed)
+    corpus = [" ".join(_random_word(rng) for _ in range(rng.randint(6, 14))) for _ in range(facts)]
+    retrieval = [" ".join(rng.choice(fact.split()) for _ in range(3)) for fact in rng.sample(corpus, 500)]
+    cases = {
+        "convo": ["hello", "how are you", "thanks", "bye"],
+        "joke": ["tell me a joke"],
+        "fact": ["give me a fact"],
+        "riddle": ["riddles"],
+        "riddle_answer": ["is it a piano", "a towel", "no idea"],
+        "retrieval": retrieval,
+        "fallback": ["qwzx vvvk", "plmokn", "zzzz yyyy xxxx"],
+    }
+    with _in_tempdir():
+        for size, label in ((0, "uncached"), (4096, "cached")):
+            core = ChatbotCore(reply_cache_size=size)
+            core.facts = corpus
+            core.fact_index.sync(corpus)
+            core.fact_index.wait()
+            for intent, texts in cases.items():
+                session = core.session(f"bench-{intent}")
+                inputs = [texts[i % len(texts)] for i in range(messages)]
+                if intent == "riddle":
+                    def call(text, session=session):
+                        core.get_reply(text, session)
+                        session.stop_riddle()
+                else:
+                    if intent == "riddle_answer":
+                        core.get_reply("riddles", session)
+                    def call(text, session=session):
+                        core.get_reply(text, session)
+                _report(f"  get_reply() {intent} ({label})", _time_per_call(call, inputs))
+            core.close()
+
+# ---------------------------
+# Content file reads
+# ---------------------------
+def _write_content_file(path, size, seed=17):
+    rng = random.Random(seed)
+    lines = [" ".join(_random_word(rng) for _ in range(rng.randint(4, 14))) + "\n" for _ in range(4096)]
+    block = "".join(lines).encode("utf-8")
+    with open(path, "wb") as f:
+        written = 0
+        while written < size:
+            chunk = block[:size - written]
+            f.write(chunk)
+            written += len(chunk)
+
+def bench_read_lines(sizes=READ_SIZES):
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            label = f"{size // MB}MB"
+            path = os.path.join(tmp, f"content_{label}.txt")
+            _write_content_file(path, size)
+            start = time.perf_counter()
+            lines = safe_read_lines(path, ["default"])
+            elapsed = time.perf_counter() - start
+            _record(f"safe_read_lines {label}", size / MB / elapsed, "MB/s")
+            print(f"  {len(lines)} lines in {elapsed:.2f}s")
+            del lines
+            start = time.perf_counter()
+            store = ContentStore(path)
+            n = len(store)
+            _record(f"ContentStore open {label} (index build)", (time.perf_counter() - start) * 1000, "ms")
+            store.close()
+            start = time.perf_counter()
+            store = ContentStore(path)
+            _record(f"ContentStore open {label} (cached index)", (time.perf_counter() - start) * 1000, "ms")
+            store.close()
+            print(f"  {n} lines indexed")
+            os.remove(path)
+            if os.path.exists(path + ".idx"):
+                os.remove(path + ".idx")
+
+# ---------------------------
+# Worker shards
+# ---------------------------
+def bench_shards(workers=(1, 2, 4, 8), facts=50000, sessions=64, messages=100, seed=9):
+    rng = random.Random(seed)
+    corpus = [" ".join(_random_word(rng) for _ in range(rng.randint(6, 14))) for _ in range(facts)]
+    # retrieval-heavy traffic: free text that has to be scored against the facts;
+    # the unique suffix keeps the reply cache out of it
+    queries = [" ".join(rng.choice(fact.split()) for _ in range(3)) + f" {i}" for i, fact in
+               enumerate(rng.choices(corpus, k=sessions * messages))]
+
+    async def drive(core):
+        async def client(s):
+            for i in range(messages):
+                await core.get_reply(f"bench-{s}", queries[s * messages + i])
+        start = time.perf_counter()
+        await asyncio.gather(*(client(s) for s in range(sessions)))
+        return time.perf_counter() - start
+
+    print(f"  {os.cpu_count()} CPUs, {facts} facts, {sessions} sessions x {messages} messages")
+    with _in_tempdir():
+        with open("facts.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(corpus) + "\n")
+        for n in workers:
+            start = time.perf_counter()
+            core = ShardedCore(n).start()
+            print(f"  {n} workers up in {time.perf_counter() - start:.1f}s")
+            try:
+                elapsed = asyncio.run(drive(core))
+            finally:
+                core.close()
+            _record(f"get_reply via {n} workers", sessions * messages / elapsed, "req/s")
+
+BENCHMARKS = {
+    "replies": bench_replies,
+    "read_lines": bench_read_lines,
+    "matcher": bench_matcher,
+    "transcript": bench_transcript,
+    "themes": bench_themes,
+    "appender": bench_appender,
+    "riddles": bench_riddles,
+    "retrieval": bench_retrieval,
+    "reply_cache": bench_reply_cache,
+    "shards": bench_shards,
+}
+
+# smaller inputs for a run that finishes in well under a minute
+QUICK = {
+    "read_lines": {"sizes": QUICK_READ_SIZES},
+    "replies": {"messages": 2000, "facts": 2000},
+    "appender": {"entries": 10000, "naive_entries": 1000},
+    "retrieval": {"facts": 50000},
+    "matcher": {"sizes": (10, 1000, 10000)},
+    "transcript": {"messages": 10000},
+    "themes": {"widgets": (100, 1000)},
+    "reply_cache": {"messages": 10000, "facts": 2000},
+    "riddles": {"checks": 5000},
+    "shards": {"workers": (1, 2, 4), "facts": 5000, "sessions": 16, "messages": 50},
+}
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def save_results(path, names, quick):
+    data = {
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "benchmarks": names,
+        "results": RESULTS,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    print(f"results saved to {path}")
+
+def compare_results(path, threshold=REGRESSION_THRESHOLD):
+    # returns the number of regressions against an earlier --json file
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[Compare error] {path}: {e}", file=sys.stderr)
+        return 0
+    print(f"== compared with {old.get('commit') or path} ==")
+    regressions = 0
+    for name, new in RESULTS.items():
+        prev = old.get("results", {}).get(name)
+        if not prev or prev["unit"] != new["unit"] or not prev["value"]:
+            continue
+        change = (new["value"] - prev["value"]) / prev["value"]
+        worse = -change if new["unit"].endswith("/s") else change
+        flag = "REGRESSION" if worse > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:<40} {prev['value']:10.2f} -> {new['value']:10.2f} {new['unit']:<8} {change:+7.1%} {flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for chatbot.py")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, e.g. for a pre-commit check")
+    parser.add_argument("--json", metavar="PATH", help="save results as JSON")
+    parser.add_argument("--compare", metavar="PATH", help="compare with an earlier --json file; exit 1 on regressions")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Choose from: {', '.join(BENCHMARKS)}", file=sys.stderr)
+            return 2
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name](**(QUICK.get(name, {}) if args.quick else {}))
+    if args.json:
+        save_results(args.json, names, args.quick)
+    if args.compare and compare_results(args.compare):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import platform
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import image_transfer
+from image_transfer import TransferEngine, fast_copy, fast_move
+from image_scanner import DEFAULT_SCAN_WORKERS, IMAGE_EXTENSIONS, is_image
+from image_catalog import ImageCatalog
+import image_dedupe
+from image_dedupe import find_duplicates, full_hash
+
+OLD_SLEEP = 0.05   # per-file sleep the old process_images loop had
+SCAN_QUEUE_SIZE = 64      # batches buffered between scanner threads and the consumer
+SCAN_BATCH = 256          # entries per batch
+
+# name -> {"value": ..., "unit": ...}, saved with --json
+RESULTS = {}
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def _record(name, value, unit):
+    RESULTS[name.strip()] = {"value": value, "unit": unit}
+    print(f"{name:<44} {value:12.2f} {unit}")
+
+def make_fixture(folder, count, size=4096, subdirs=0):
+    # count images of `size` bytes, spread over `subdirs` subfolders (0 = flat)
+    os.makedirs(folder, exist_ok=True)
+    payload = os.urandom(size)
+    names = []
+    for i in range(count):
+        sub = folder if not subdirs else os.path.join(folder, f"d{i % subdirs:04d}")
+        if sub != folder and not os.path.isdir(sub):
+            os.makedirs(sub)
+        name = f"img_{i:07d}.{'jpg' if i % 3 else 'png'}"
+        with open(os.path.join(sub, name), "wb") as f:
+            f.write(payload[: size - 8] + i.to_bytes(8, "little"))
+        names.append(name)
+    return names
+
+def _run_engine(action, jobs, workers):
+    engine = TransferEngine(action, jobs, workers=workers)
+    start = time.perf_counter()
+    engine.start()
+    while True:
+        event = engine.events.get()
+        if event[0] == "done":
+            break
+    return time.perf_counter() - start, len(event[1])
+
+# -----------------------------
+# Transfer engine
+# -----------------------------
+def bench_transfer(counts=(10000, 100000), workers=(1, 4, 16), size=4096):
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in counts:
+            src = os.path.join(tmp, f"src_{count}")
+            names = make_fixture(src, count, size)
+
+            dest = os.path.join(tmp, f"old_{count}")
+            os.makedirs(dest)
+            start = time.perf_counter()
+            for name in names:
+                shutil.copy2(os.path.join(src, name), os.path.join(dest, name))
+            elapsed = time.perf_counter() - start
+            shutil.rmtree(dest)
+            _record(f"copy {count}, sequential loop", count / elapsed, "files/s")
+            print(f"  the old loop's sleep alone added {count * OLD_SLEEP:.0f}s on top of that")
+
+            for n in workers:
+                dest = os.path.join(tmp, f"copy_{count}_{n}")
+                os.makedirs(dest)
+                jobs = [(os.path.join(src, name), os.path.join(dest, name), name) for name in names]
+                elapsed, done = _run_engine(shutil.copy2, jobs, n)
+                shutil.rmtree(dest)
+                _record(f"copy {count}, engine {n} workers", done / elapsed, "files/s")
+
+            dest = os.path.join(tmp, f"move_{count}")
+            os.makedirs(dest)
+            jobs = [(os.path.join(src, name), os.path.join(dest, name), name) for name in names]
+            elapsed, done = _run_engine(shutil.move, jobs, max(workers))
+            _record(f"move {count}, engine {max(workers)} workers", done / elapsed, "files/s")
+            shutil.rmtree(dest)
+            shutil.rmtree(src)
+
+# -----------------------------
+# Copy backends
+# -----------------------------
+def bench_backends(files=100, size=8 * 1024 * 1024):
+    # large photos: wall time and the CPU this process burns doing the copy
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "src")
+        names = make_fixture(src, files, size)
+        for label, func in (("shutil.copy2", shutil.copy2), ("fast_copy", fast_copy)):
+            dest = os.path.join(tmp, "dest")
+            os.makedirs(dest)
+            image_transfer.copy_methods.clear()
+            wall, cpu = time.perf_counter(), time.process_time()
+            for name in names:
+                func(os.path.join(src, name), os.path.join(dest, name))
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            _record(f"copy {files} x {size >> 20}MB, {label}", files * size / (1 << 20) / wall, "MB/s")
+            _record(f"copy {files} x {size >> 20}MB, {label} CPU", cpu * 1000 / files, "ms/file")
+            if image_transfer.copy_methods:
+                print(f"  methods used: {image_transfer.copy_methods}")
+            shutil.rmtree(dest)
+
+        for label, func in (("shutil.move", shutil.move), ("fast_move", fast_move)):
+            dest = os.path.join(tmp, "moved")
+            os.makedirs(dest)
+            start = time.perf_counter()
+            for name in names:
+                func(os.path.join(src, name), os.path.join(dest, name))
+            _record(f"move {files} files, {label}", files / (time.perf_counter() - start), "files/s")
+            shutil.rmtree(src)
+            os.rename(dest, src)
+
+# -----------------------------
+# Directory scans
+# -----------------------------
+def _walk_list(folder):
+    # what delete_images_recursive used to do
+    found = []
+    for root, dirs, files in os.walk(folder):
+        for f in files:
+            if f.strip().lower().endswith(('.jpg', '.png')):
+                found.append(os.path.join(root, f))
+    return found
+
+# scan_tree() walks a whole tree on `workers` threads and yields the
+# os.DirEntry of every image, streaming rather than building a list. The app
+# lists through ImageCatalog instead; this is kept as the baseline that the
+# catalog's refresh is measured against.
+def _iter_dir(folder, extensions, on_dir):
+    # images in one directory; subdirectories are handed to on_dir
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        on_dir(entry.path)
+                    elif is_image(entry.name, extensions):
+                        yield entry
+                except OSError:
+                    continue
+    except OSError:
+        return
+
+def scan_tree(folder, extensions=IMAGE_EXTENSIONS, workers=DEFAULT_SCAN_WORKERS):
+    if workers <= 1:
+        stack = [folder]
+        while stack:
+            yield from _iter_dir(stack.pop(), extensions, stack.append)
+        return
+    yield from _ParallelScan(folder, extensions, workers)
+
+class _ParallelScan:
+    # Worker threads pull directories from a shared queue and push what they
+    # find into a bounded queue that the consumer iterates, so memory stays
+    # flat however many files the tree holds. Stopping iteration early
+    # (break / close()) stops the workers.
+    def __init__(self, folder, extensions, workers):
+        self.extensions = extensions
+        self.dirs = queue.Queue()
+        self.out = queue.Queue(maxsize=SCAN_QUEUE_SIZE)
+        self.stop = threading.Event()
+        self.pending = 1          # directories queued or being listed
+        self.lock = threading.Lock()
+        self.dirs.put(folder)
+        self.threads = [threading.Thread(target=self._work, name=f"scan-{i}", daemon=True) for i in range(workers)]
+
+    def __iter__(self):
+        for t in self.threads:
+            t.start()
+        try:
+            while True:
+                batch = self.out.get()
+                if batch is None:
+                    return
+                yield from batch
+        finally:
+            self.stop.set()
+
+    def _add_dir(self, path):
+        with self.lock:
+            self.pending += 1
+        self.dirs.put(path)
+
+    def _put(self, item):
+        while not self.stop.is_set():
+            try:
+                self.out.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _work(self):
+        while not self.stop.is_set():
+            try:
+                folder = self.dirs.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if folder is None:
+                return
+            batch = []
+            for entry in _iter_dir(folder, self.extensions, self._add_dir):
+                batch.append(entry)
+                if len(batch) >= SCAN_BATCH:
+                    self._put(batch)
+                    batch = []
+                    if self.stop.is_set():
+                        return
+            if batch:
+                self._put(batch)
+            with self.lock:
+                self.pending -= 1
+                finished = self.pending == 0
+            if finished:
+                # wake the other workers and end the consumer's loop
+                for _ in self.threads:
+                    self.dirs.put(None)
+                self._put(None)
+                return
+
+def _count_scan(folder, workers):
+    return sum(1 for _ in scan_tree(folder, workers=workers))
+
+def bench_scan(count=100000, subdirs=1000, workers=(1, 4, 8)):
+    with tempfile.TemporaryDirectory() as tmp:
+        make_fixture(tmp, count, 64, subdirs)
+        runs = [("os.walk + list", lambda: len(_walk_list(tmp)))]
+        runs += [(f"scan_tree {n} workers", lambda n=n: _count_scan(tmp, n)) for n in workers]
+        for label, func in runs:
+            start = time.perf_counter()
+            found = func()
+            _record(f"scan {count} files, {label}", found / (time.perf_counter() - start), "files/s")
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            _record(f"scan {count} files, {label} peak", peak / 1024, "KB")
+
+# -----------------------------
+# Catalog
+# -----------------------------
+def bench_catalog(count=100000, subdirs=1000, changed=10):
+    # a full scan against the catalog's first run, an untouched rerun, and a
+    # rerun after files were added to a few folders
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = os.path.join(tmp, "tree")
+        make_fixture(tree, count, 64, subdirs)
+        # directories listed moments ago are always listed again (mtime
+        # granularity), so age the fixture like a real archive
+        old = time.time() - 3600
+        for folder, _, _ in os.walk(tree):
+            os.utime(folder, (old, old))
+
+        start = time.perf_counter()
+        found = _count_scan(tree, 1)
+        _record(f"catalog {count} files, scan_tree", (time.perf_counter() - start) * 1000, "ms")
+
+        catalog = ImageCatalog(os.path.join(tmp, "catalog.sqlite"))
+        start = time.perf_counter()
+        catalog.refresh(tree)
+        _record(f"catalog {count} files, first refresh", (time.perf_counter() - start) * 1000, "ms")
+
+        start = time.perf_counter()
+        listed, reused = catalog.refresh(tree)
+        _record(f"catalog {count} files, unchanged refresh", (time.perf_counter() - start) * 1000, "ms")
+        print(f"  listed {listed} directories, reused {reused}")
+
+        for i in range(changed):
+            with open(os.path.join(tree, f"d{i:04d}", "new.jpg"), "wb") as f:
+                f.write(b"x")
+        start = time.perf_counter()
+        listed, reused = catalog.refresh(tree)
+        _record(f"catalog {count} files, {changed} folders changed", (time.perf_counter() - start) * 1000, "ms")
+        print(f"  listed {listed} directories, reused {reused}")
+
+        start = time.perf_counter()
+        counted = catalog.count(tree)
+        _record(f"catalog {count} files, delete preview count", (time.perf_counter() - start) * 1000, "ms")
+        assert counted == found + changed, (counted, found)
+        catalog.close()
+
+# -----------------------------
+# Deduplication
+# -----------------------------
+def make_dedupe_fixture(archive, dump, count, new, dupes, subdirs):
+    # `count` archive images over `subdirs` folders with sizes spread like
+    # photos (some collide), every 100th one from a handful of large sizes
+    # that need a full hash to confirm; and a camera dump of `new` fresh
+    # images plus `dupes` renamed copies of archive images
+    payload = os.urandom(256 * 1024)
+    def write(path, i):
+        size = 200 * 1024 + i // 100 % 20 if i % 100 == 0 else 2048 + i * 7919 % 65536
+        with open(path, "wb") as f:
+            f.write(i.to_bytes(8, "little") + payload[8:size])
+    for i in range(count):
+        sub = os.path.join(archive, f"d{i % subdirs:04d}")
+        os.makedirs(sub, exist_ok=True)
+        write(os.path.join(sub, f"img_{i:07d}.jpg"), i)
+    os.makedirs(dump)
+    for i in range(new):
+        write(os.path.join(dump, f"DSC_{i:05d}.jpg"), count + i)
+    for j in range(dupes):
+        i = j * (count // dupes)
+        shutil.copyfile(os.path.join(archive, f"d{i % subdirs:04d}", f"img_{i:07d}.jpg"),
+                        os.path.join(dump, f"IMG_{j:05d}.jpg"))
+
+def bench_dedupe(count=100000, new=2000, dupes=500, subdirs=1000):
+    with tempfile.TemporaryDirectory() as tmp:
+        archive, dump = os.path.join(tmp, "archive"), os.path.join(tmp, "dump")
+        make_dedupe_fixture(archive, dump, count, new, dupes, subdirs)
+        catalog = ImageCatalog(os.path.join(tmp, "catalog.sqlite"))
+        catalog.refresh(archive)
+        catalog.refresh(dump)
+        total = count + new + dupes
+
+        # what a plain "hash everything" pass costs
+        start = time.perf_counter()
+        seen = {}
+        expected = set()
+        for path, size, _, _ in list(catalog.iter_files(archive)) + list(catalog.iter_files(dump)):
+            digest = full_hash(path, size)
+            if digest in seen:
+                expected.add(path)
+            seen.setdefault(digest, path)
+        _record(f"dedupe {total} files, full hash of everything", (time.perf_counter() - start) * 1000, "ms")
+        _record(f"dedupe {total} files, full hash of everything read",
+                sum(size for _, size, _, _ in catalog.iter_files(tmp)) / (1 << 20), "MB")
+
+        for label, cache in (("no cache", None), ("cold cache", catalog), ("warm cache", catalog)):
+            start = time.perf_counter()
+            found = find_duplicates(catalog.iter_files(archive), catalog.iter_files(dump), cache)
+            _record(f"dedupe {total} files, find_duplicates {label}", (time.perf_counter() - start) * 1000, "ms")
+            stats = image_dedupe.hash_stats
+            _record(f"dedupe {total} files, find_duplicates {label} read", stats["bytes"] / (1 << 20), "MB")
+            print(f"  hashed {stats['partial']} partial, {stats['full']} full, {stats['cached']} from cache;"
+                  f" {len(found)} duplicates")
+            assert set(found) == expected, (len(found), len(expected))
+        catalog.close()
+
+BENCHMARKS = {
+    "transfer": bench_transfer,
+    "scan": bench_scan,
+    "backends": bench_backends,
+    "catalog": bench_catalog,
+    "dedupe": bench_dedupe,
+}
+
+QUICK = {
+    "transfer": {"counts": (2000,)},
+    "backends": {"files": 20},
+    "scan": {"count": 10000, "subdirs": 100},
+    "catalog": {"count": 10000, "subdirs": 100},
+    "dedupe": {"count": 10000, "new": 500, "dupes": 100, "subdirs": 100},
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the image manager")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="smaller fixtures")
+    parser.add_argument("--json", metavar="PATH", help="save results as JSON")
+    args = parser.parse_args(argv)
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Choose from: {', '.join(BENCHMARKS)}", file=sys.stderr)
+            return 2
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name](**(QUICK.get(name, {}) if args.quick else {}))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                       "platform": platform.platform(), "quick": args.quick, "results": RESULTS}, f, indent=2)
+        print(f"results saved to {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
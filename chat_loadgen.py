@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+from chat_server import DEFAULT_HOST, DEFAULT_PORT
+
+MESSAGES = ["hello", "how are you", "tell me a joke", "give me a fact", "riddles", "skip", "thanks", "bye"]
+
+# ---------------------------
+# Load generator
+# ---------------------------
+async def run_client(host, port, count, latencies, errors, seed):
+    rng = random.Random(seed)
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append("connect")
+        return
+    try:
+        for _ in range(count):
+            msg = rng.choice(MESSAGES)
+            start = time.perf_counter()
+            writer.write(msg.encode("utf-8") + b"\n")
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                errors.append("closed")
+                return
+            latencies.append(time.perf_counter() - start)
+            if "error" in json.loads(line):
+                errors.append("server")
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+async def run_load(host, port, clients, messages):
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(host, port, messages, latencies, errors, i) for i in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running chat_server.py")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("-c", "--clients", type=int, default=50)
+    parser.add_argument("-n", "--messages", type=int, default=200, help="messages per client")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_load(args.host, args.port, args.clients, args.messages))
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"{result['requests']} requests from {result['clients']} clients in {result['seconds']:.2f}s "
+              f"({result['errors']} errors)")
+        print(f"throughput: {result['rps']:.0f} req/s")
+        print(f"latency p50: {result['p50_ms']:.2f} ms  p99: {result['p99_ms']:.2f} ms")
+    return 1 if result["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import multiprocessing
+import queue
+import sys
+import threading
+
+from chatbot import ChatbotCore, TranscriptLog, METRICS, SESSION_MAX, SESSION_TTL, TRANSCRIPT_LOG_FILE
+
+# ---------------------------
+# Configuration & Constants
+# ---------------------------
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_CONNECTIONS = 1000
+DEFAULT_IDLE_TIMEOUT = 300       # seconds without a message before we hang up
+MAX_LINE_BYTES = 64 * 1024
+WRITE_HIGH_WATER = 256 * 1024    # pause reading a client once this much reply data is queued
+RING_REPLICAS = 128              # virtual nodes per worker on the hash ring
+
+# ---------------------------
+# Worker shards
+# ---------------------------
+# With --workers N every worker process holds its own ChatbotCore. Content
+# files are opened as mmap'd ContentStores, so all workers share the same
+# page-cache copy of jokes/facts; only per-worker state (sessions, fact
+# index, reply cache) is private. Sessions are pinned to a worker through a
+# consistent-hash ring, so riddle state never has to move.
+class HashRing:
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        points = sorted((self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def node_for(self, key):
+        i = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+def _shard_worker(conn, index, log_path, core_kwargs):
+    log = TranscriptLog(f"{log_path}.{index}") if log_path else None
+    core = ChatbotCore(transcript_log=log, **core_kwargs)
+    core.start_watcher()
+    core.fact_index.wait()
+    conn.send(("ready", index, None))
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            req_id, op, session_id, text = msg
+            if op == "drop":
+                core.sessions.drop(session_id)
+                continue
+            session = core.session(session_id)
+            try:
+                reply, meta = core.get_reply(text, session)
+                if meta.get('clear_riddle'):
+                    core.stop_riddle(session)
+            except Exception as e:
+                print(f"[Worker {index} error] {e}", file=sys.stderr)
+                reply, meta = None, {"error": "internal error"}
+            conn.send((req_id, reply, meta))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        core.close()
+
+class _Shard:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.pending = {}
+        self.outbox = queue.Queue()   # messages for the worker; only the writer thread sends
+        self.reader = None
+        self.writer = None
+
+class ShardedCore:
+    # Front-end half of the worker pool: get_reply() is a coroutine that
+    # queues the message for the session's worker and awaits its answer.
+    # Each worker has a writer thread, so a busy worker with a full pipe
+    # blocks that thread and not the event loop, and a reader thread whose
+    # replies are handed to the event loop.
+    def __init__(self, workers, transcript_log=None, **core_kwargs):
+        self.workers = workers
+        self.transcript_log = transcript_log
+        self.core_kwargs = core_kwargs
+        self.ring = HashRing(range(workers))
+        self._shards = []
+        self._ids = itertools.count(1)
+
+    def start(self):
+        # spawn rather than fork: the front-end may already run threads
+        ctx = multiprocessing.get_context("spawn")
+        for i in range(self.workers):
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_shard_worker, name=f"chat-worker-{i}",
+                                  args=(child, i, self.transcript_log, self.core_kwargs), daemon=True)
+            process.start()
+            child.close()
+            self._shards.append(_Shard(process, parent))
+        for shard in self._shards:
+            shard.conn.recv()  # ("ready", index, None)
+            shard.reader = threading.Thread(target=self._read, args=(shard,), name="shard-reader", daemon=True)
+            shard.writer = threading.Thread(target=self._write, args=(shard,), name="shard-writer", daemon=True)
+            shard.reader.start()
+            shard.writer.start()
+        return self
+
+    def worker_for(self, session_id):
+        return self.ring.node_for(session_id)
+
+    async def get_reply(self, session_id, text):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        shard = self._shards[self.ring.node_for(session_id)]
+        shard.pending[req_id] = (loop, fut)
+        shard.outbox.put((req_id, "reply", session_id, text))
+        return await fut
+
+    def drop(self, session_id):
+        shard = self._shards[self.ring.node_for(session_id)]
+        shard.outbox.put((0, "drop", session_id, None))
+
+    def close(self):
+        for shard in self._shards:
+            shard.outbox.put(None)  # sent after everything already queued
+        for shard in self._shards:
+            shard.writer.join(timeout=5)
+            shard.process.join(timeout=5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+        self._shards = []
+
+    def _write(self, shard):
+        while True:
+            msg = shard.outbox.get()
+            try:
+                shard.conn.send(msg)
+            except OSError:
+                # the worker is gone: fail the request instead of sending it
+                waiter = shard.pending.pop(msg[0], None) if msg else None
+                if waiter is not None:
+                    loop, fut = waiter
+                    loop.call_soon_threadsafe(_fail, fut, ConnectionError("chat worker is gone"))
+            if msg is None:
+                return
+
+    def _read(self, shard):
+        while True:
+            try:
+                req_id, reply, meta = shard.conn.recv()
+            except (EOFError, OSError):
+                break
+            waiter = shard.pending.pop(req_id, None)
+            if waiter is not None:
+                loop, fut = waiter
+                loop.call_soon_threadsafe(_resolve, fut, (reply, meta))
+        # the worker exited: fail whatever it still owed
+        for loop, fut in list(shard.pending.values()):
+            loop.call_soon_threadsafe(_fail, fut, ConnectionError("chat worker exited"))
+        shard.pending.clear()
+
+def _resolve(fut, result):
+    if not fut.done():
+        fut.set_result(result)
+
+def _fail(fut, exc):
+    if not fut.done():
+        fut.set_exception(exc)
+
+# ---------------------------
+# Line protocol server
+# ---------------------------
+# One UTF-8 message per line in, one JSON object per line out:
+#   {"reply": "...", "meta": {...}}
+# Each connection gets its own session. A client is only read again once its
+# previous reply has been drained, which gives per-connection backpressure.
+# With a ShardedCore as `core` replies come from the worker processes.
+class ChatServer:
+    def __init__(self, core=None, max_connections=DEFAULT_MAX_CONNECTIONS, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.core = core or ChatbotCore()
+        self.sharded = isinstance(self.core, ShardedCore)
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.active = 0
+        self.served = 0
+        self._ids = itertools.count(1)
+        self._server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self._server = await asyncio.start_server(self._handle, host, port, limit=MAX_LINE_BYTES)
+        return self._server
+
+    async def serve_forever(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await self.start(host, port)
+        addrs = ", ".join(str(s.getsockname()) for s in server.sockets)
+        print(f"[Chat server] listening on {addrs}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    async def _send(self, writer, obj):
+        writer.write(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        if self.active >= self.max_connections:
+            try:
+                await self._send(writer, {"error": "server busy"})
+            finally:
+                writer.close()
+            return
+        self.active += 1
+        writer.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        session_id = f"conn-{next(self._ids)}"
+        session = None if self.sharded else self.core.session(session_id)
+        try:
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except ValueError:
+                    # line longer than MAX_LINE_BYTES
+                    await self._send(writer, {"error": "line too long"})
+                    break
+                if not line:
+                    break
+                text = line.decode("utf-8", errors="replace").strip()
+                if not text:
+                    continue
+                if self.sharded:
+                    reply, meta = await self.core.get_reply(session_id, text)
+                    if reply is None:
+                        await self._send(writer, meta)
+                        continue
+                else:
+                    reply, meta = self.core.get_reply(text, session)
+                    if meta.get('clear_riddle'):
+                        self.core.stop_riddle(session)
+                self.served += 1
+                await self._send(writer, {"reply": reply, "meta": meta})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.active -= 1
+            if self.sharded:
+                self.core.drop(session_id)
+            else:
+                self.core.sessions.drop(session_id)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+# ---------------------------
+# Run the server
+# ---------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve pythonChatbot over a line protocol")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-connections", type=int, default=DEFAULT_MAX_CONNECTIONS)
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT)
+    parser.add_argument("--max-sessions", type=int, default=SESSION_MAX)
+    parser.add_argument("--session-ttl", type=float, default=SESSION_TTL)
+    parser.add_argument("--transcript-log", default=TRANSCRIPT_LOG_FILE, metavar="PATH",
+                        help="record every turn to this binary log ('' to disable); "
+                             "with --workers each worker writes PATH.<n>")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="answer in this many worker processes, sessions pinned by consistent hashing "
+                             "(default: in-process)")
+    args = parser.parse_args(argv)
+
+    if args.workers > 0:
+        core = ShardedCore(args.workers, args.transcript_log or None,
+                           max_sessions=args.max_sessions, session_ttl=args.session_ttl).start()
+    else:
+        log = TranscriptLog(args.transcript_log) if args.transcript_log else None
+        core = ChatbotCore(max_sessions=args.max_sessions, session_ttl=args.session_ttl, transcript_log=log)
+        core.start_watcher()
+    METRICS.start_exporter()
+    server = ChatServer(core, args.max_connections, args.idle_timeout)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    core.close()
+    METRICS.stop_exporter()
+
+if __name__ == "__main__":
+    main()
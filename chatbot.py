@@ -1,18 +1,78 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
+_TK_IMPORTED = time.perf_counter()
 import threading
-import time
 import os
 import random
 import sys
+import json
+import queue
+import tempfile
+import hashlib
+import mmap
+import struct
+import math
+import bisect
+import re
+import functools
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+_IMPORTS_DONE = time.perf_counter()
 
 # ---------------------------
 # Configuration & Constants
 # ---------------------------
 JOKES_FILE = "jokes.txt"
 FACTS_FILE = "facts.txt"
+RIDDLES_FILE = "riddles.txt"  # one riddle per line: question | answer | other accepted answers, ;-separated
+INDEX_SUFFIX = ".idx"     # line-offset index cached next to each content file
+APPEND_COMMIT_INTERVAL = 1.0  # seconds between group commits of added jokes/facts
+CONTENT_POLL_INTERVAL = 2.0   # mtime polling period when inotify is not available
 VOICE_RATE = 160
 VOICE_ENABLED_DEFAULT = True
+TTS_QUEUE_SIZE = 4        # utterances waiting to be spoken; the oldest is dropped when full
+TTS_CACHE_AFTER = 2       # render a reply to a wav once it has been spoken this many times
+TTS_CACHE_MAX = 64
+TTS_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pythonChatbot_tts")
+SESSION_MAX = 50000
+SESSION_TTL = 30 * 60  # seconds of inactivity before a session is dropped
+TRANSCRIPT_LOG_FILE = "transcript.log"
+LOG_COMMIT_INTERVAL = 0.5     # seconds between group commits of logged turns
+LOG_CHECKPOINT_EVERY = 1024   # records between index checkpoints
+REPLY_CACHE_SIZE = 4096   # memoised replies for deterministic intents (0 disables)
+SAMPLER_RECENT = 32       # weighted draws avoid this many of a session's latest picks
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_MIN_SCORE = 1.0      # below this the fixed fallback reply is used instead of a fact
+BM25_MAX_DF = 0.05        # query terms in more than this share of facts are ignored
+BM25_INLINE_SYNC = 2000   # index this many new facts on the reply path, more in the background
+BM25_MAX_POSTINGS = 256   # longer postings only rescore docs found via rarer terms
+# One worker keeps the GUI conversation's riddle state updated in message order;
+# replies are also re-sequenced before display so more workers stay safe to show.
+REPLY_WORKERS = 1
+STARTUP_DEFER_MS = 50     # start background loading this long after the first frame
+PROFILE_STARTUP_ENV = "CHATBOT_PROFILE_STARTUP"
+METRICS_ENV = "CHATBOT_METRICS"                  # set to 1 to collect timings and counters
+METRICS_FILE_ENV = "CHATBOT_METRICS_FILE"        # Prometheus text file to rewrite (default: stdout)
+METRICS_INTERVAL_ENV = "CHATBOT_METRICS_INTERVAL"
+METRICS_INTERVAL = 15.0   # seconds between metric exports
+METRICS_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATS_REFRESH_MS = 1000
+REPLY_POLL_MS = 30
+REPLY_BATCH = 50
+TRANSCRIPT_MAX_ONSCREEN = 500   # messages kept in the chat widget
+TRANSCRIPT_PAGE = 100           # messages paged back in when scrolling to the top
+TRANSCRIPT_FLUSH_MS = 16        # coalesce inserts into one widget update per frame
+RIDDLE_HINT = "(Type your answer directly in the input box. Type 'skip' to see the answer.)"
 
 DEFAULT_JOKES = [
     "Why don't scientists trust atoms? Because they make up everything!",
@@ -42,13 +102,20 @@ CONVO_MAP = {
     "good night": "Good night... take care"
 }
 
+RIDDLE_TRIGGERS = ("riddle", "riddles", "ask riddle", "give me a riddle", "RIDDLES", "RIDDLE", "please give me a riddle")
+HOW_ARE_KEYWORDS = ("how are", "how's it going", "how are you doing")
+JOKE_KEYWORDS = ("joke",)
+FACT_KEYWORDS = ("fact", "did you know")
+RANDOM_INTENTS = frozenset(("riddle", "joke", "fact"))  # replies that draw random content are never cached
+FALLBACK_REPLY = "I didn't get that. Try: 'hello', 'how are you', 'riddles', 'jokes', or 'facts'."
+
 RIDDLES = [
     {"q": "I speak without a mouth and hear without ears. I have nobody, but I come alive with wind. What am I?",
-     "a": "echo "},
+     "a": "echo ", "alts": ["an echo"]},
     {"q": "I come from a mine and get surrounded by wood always. Everyone uses me. What am I?",
-     "a": "pencil lead"},
+     "a": "pencil lead", "alts": ["graphite", "lead", "pencil graphite"]},
     {"q": "What has keys but can't open locks?",
-     "a": "piano"}
+     "a": "piano", "alts": ["a piano", "keyboard"]}
 ]
 
 # Theme definitions: each theme is a dict of colors used in several widgets
@@ -80,10 +147,247 @@ THEMES = {
 }
 
 DEFAULT_THEME = "Dark"
+THEMES_FILE = "themes.json"   # {"Name": {"bg": "#rrggbb", ...}, ...}; the built-in THEMES when missing
+THEME_BASE = "clam"           # ttk theme whose elements honour the colours below
+THEME_REQUIRED = ("bg", "top_bg", "ctrl_bg", "chat_bg", "chat_fg", "entry_bg")
+# optional colour roles and the role each one falls back to
+THEME_FALLBACKS = {"title_fg": "chat_fg", "label_fg": "chat_fg", "button_bg": "top_bg",
+                   "button_fg": "chat_fg", "active_bg": "ctrl_bg"}
+# ttk style -> {option: colour role}; every themed widget uses one of these
+THEME_STYLES = {
+    "TFrame": {"background": "bg"},
+    "Top.TFrame": {"background": "top_bg"},
+    "Ctrl.TFrame": {"background": "ctrl_bg"},
+    "Entry.TFrame": {"background": "entry_bg"},
+    "TLabel": {"background": "bg", "foreground": "chat_fg"},
+    "Title.TLabel": {"background": "top_bg", "foreground": "title_fg"},
+    "Top.TCheckbutton": {"background": "top_bg", "foreground": "title_fg"},
+    "Ctrl.TLabelframe": {"background": "ctrl_bg"},
+    "Ctrl.TLabelframe.Label": {"background": "ctrl_bg", "foreground": "label_fg"},
+    "TButton": {"background": "button_bg", "foreground": "button_fg"},
+    "TEntry": {"fieldbackground": "chat_bg", "foreground": "chat_fg"},
+    "Treeview": {"background": "chat_bg", "fieldbackground": "chat_bg", "foreground": "chat_fg"},
+}
+# ttk style -> {option: [(state, colour role)]}
+THEME_MAPS = {
+    "TButton": {"background": [("active", "active_bg")]},
+    "Top.TCheckbutton": {"background": [("active", "top_bg")]},
+}
+
+# ---------------------------
+# Startup profiling
+# ---------------------------
+class StartupProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = []
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        if self.enabled:
+            with self._lock:
+                self.timings.append((name, seconds, threading.current_thread().name))
+
+    @contextmanager
+    def measure(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self, out=None):
+        out = out or sys.stderr
+        print("[Startup profile]", file=out)
+        with self._lock:
+            timings = list(self.timings)
+        for name, seconds, thread in timings:
+            print(f"  {name:<28} {seconds * 1000:9.1f} ms  ({thread})", file=out)
+
+STARTUP = StartupProfiler(enabled=bool(os.environ.get(PROFILE_STARTUP_ENV)))
+STARTUP.record("import tkinter", _TK_IMPORTED - _IMPORT_STARTED)
+STARTUP.record("import other modules", _IMPORTS_DONE - _TK_IMPORTED)
+
+# ---------------------------
+# Metrics
+# ---------------------------
+class Histogram:
+    # Prometheus-style cumulative buckets; percentiles are interpolated
+    # inside the bucket that holds them.
+    def __init__(self, bounds=METRICS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def percentile(self, pct):
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lo + (hi - lo) * max(0.0, rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+class Metrics:
+    # Counters and histograms keyed by (name, labels). Every entry point
+    # returns straight away when disabled, so instrumented code costs one
+    # attribute check unless CHATBOT_METRICS is set.
+    def __init__(self, enabled=False, path=None, interval=METRICS_INTERVAL):
+        self.enabled = enabled
+        self.path = path
+        self.interval = interval
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._stop = threading.Event()
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start, **labels)
+            return wrapper
+        return decorate
+
+    def counter(self, name, **labels):
+        return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def summary(self, name, label):
+        # [(label value, count, p50, p90, p99)] for one histogram, busiest first
+        with self._lock:
+            rows = [(dict(labels).get(label, ""), h.count, h.percentile(50), h.percentile(90), h.percentile(99))
+                    for (n, labels), h in self.histograms.items() if n == name]
+        return sorted(rows, key=lambda row: -row[1])
+
+    def render(self):
+        # Prometheus text exposition format
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.count, h.total, h.bounds))
+                                for key, h in self.histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{fmt(labels)} {value}")
+        for (name, labels), (counts, count, total, bounds) in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(list(bounds) + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{fmt(labels)} {total}")
+            lines.append(f"{name}_count{fmt(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, out=None):
+        text = self.render()
+        if self.path:
+            # write-then-rename so a scraper never reads a half-written file
+            try:
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"[Metrics error] {self.path}: {e}", file=sys.stderr)
+        else:
+            out = out or sys.stdout
+            out.write(text)
+            out.flush()
+
+    def start_exporter(self, out=None):
+        if not self.enabled or self._exporter is not None:
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.wait(self.interval):
+                self.export(out)
+
+        self._exporter = threading.Thread(target=_run, name="metrics", daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self, out=None):
+        # stops the interval thread and writes one last snapshot
+        if self._exporter is None:
+            return
+        self._stop.set()
+        self._exporter.join(timeout=1.0)
+        self._exporter = None
+        self.export(out)
+
+def _metrics_interval():
+    try:
+        return max(0.1, float(os.environ.get(METRICS_INTERVAL_ENV, METRICS_INTERVAL)))
+    except ValueError:
+        return METRICS_INTERVAL
+
+METRICS = Metrics(enabled=bool(os.environ.get(METRICS_ENV)), path=os.environ.get(METRICS_FILE_ENV) or None,
+                  interval=_metrics_interval())
 
 # ---------------------------
 # File handling utilities
 # ---------------------------
+@METRICS.timed("chatbot_file_read_seconds")
 def safe_read_lines(filepath, default_list):
     try:
         if not os.path.exists(filepath):
@@ -101,119 +405,2070 @@ def safe_read_lines(filepath, default_list):
         print(f"[File read error] {filepath}: {e}", file=sys.stderr)
         return list(default_list)
 
+def _needs_newline(filepath):
+    # True when the file has content that is not newline-terminated yet
+    try:
+        with open(filepath, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return False
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+    except OSError:
+        return False
+
+@METRICS.timed("chatbot_file_append_seconds")
 def append_line_to_file(filepath, text):
     try:
+        prefix = "\n" if _needs_newline(filepath) else ""
         with open(filepath, "a", encoding="utf-8") as f:
-            f.write("\n" + text.strip())
+            f.write(prefix + text.strip() + "\n")
     except Exception as e:
         print(f"[File write error] {filepath}: {e}", file=sys.stderr)
 
+def _content_key(text):
+    # 64-bit digest of the normalised text, for duplicate checks
+    norm = " ".join(text.split()).casefold()
+    return int.from_bytes(hashlib.blake2b(norm.encode("utf-8"), digest_size=8).digest(), "little")
+
+class ContentAppender:
+    # Write-behind appender for a content file. add() only buffers; a
+    # background thread group-commits the buffer every `interval` seconds
+    # with a single write + fsync of newline-terminated records. Entries
+    # already in the file (or added before) are skipped via a set of 64-bit
+    # digests, built on first use from `existing`.
+    # on_commit(texts, offsets) is told where each committed record starts.
+    def __init__(self, filepath, interval=APPEND_COMMIT_INTERVAL, existing=None, on_commit=None):
+        self.filepath = filepath
+        self.interval = interval
+        self.on_commit = on_commit
+        self._existing = existing
+        self._seen = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+
+    def add(self, text):
+        # returns the text as it will be stored, or None if empty/duplicate
+        text = " ".join(text.splitlines()).strip()
+        if not text:
+            return None
+        key = _content_key(text)
+        with self._lock:
+            seen = self._seen_keys()
+            if key in seen:
+                return None
+            seen.add(key)
+            self._buffer.append(text)
+            self._ensure_thread()
+        return text
+
+    def add_many(self, texts):
+        return sum(1 for text in texts if self.add(text) is not None)
+
+    def pending(self):
+        return len(self._buffer)
+
+    def flush(self):
+        with self._commit_lock:
+            with self._lock:
+                batch = self._buffer
+                self._buffer = []
+            if not batch:
+                return []
+            try:
+                offsets = self._write(batch)
+            except OSError as e:
+                print(f"[File write error] {self.filepath}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._buffer[:0] = batch
+                return []
+            if self.on_commit is not None:
+                self.on_commit(batch, offsets)
+            return offsets
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def _seen_keys(self):
+        if self._seen is None:
+            self._seen = {_content_key(line) for line in (self._existing or ())}
+            self._existing = None
+        return self._seen
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="content-commit", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+            if not self._buffer:
+                break  # idle: the next add() starts a new committer
+
+    def _write(self, batch):
+        prefix = b"\n" if _needs_newline(self.filepath) else b""
+        records = [text.encode("utf-8") + b"\n" for text in batch]
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        fd = os.open(self.filepath, flags, 0o644)
+        try:
+            pos = os.fstat(fd).st_size + len(prefix)
+            offsets = []
+            for rec in records:
+                offsets.append(pos)
+                pos += len(rec)
+            data = memoryview(prefix + b"".join(records))
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return offsets
+
+# ---------------------------
+# Intent matching
+# ---------------------------
+class IntentMatcher:
+    # Exact phrases live in a dict, keywords in an Aho-Corasick automaton, so a
+    # lookup is one hash plus one pass over the text however many intents exist.
+    # Rules win in the order they were added, like the old if-chain.
+    def __init__(self):
+        self.rules = []
+        self.exact = {}
+        self.keywords = []
+        self._goto = None
+        self._best = None
+
+    def add_exact(self, phrase, intent, payload=None):
+        self.rules.append((intent, payload))
+        self.exact.setdefault(phrase, len(self.rules) - 1)
+        self._goto = None
+
+    def add_keyword(self, keyword, intent, payload=None):
+        if not keyword:
+            return
+        self.rules.append((intent, payload))
+        self.keywords.append((keyword, len(self.rules) - 1))
+        self._goto = None
+
+    def compile(self):
+        no_match = len(self.rules)
+        goto = [{}]
+        best = [no_match]
+        for keyword, prio in self.keywords:
+            node = 0
+            for ch in keyword:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[node][ch] = nxt
+                    goto.append({})
+                    best.append(no_match)
+                node = nxt
+            best[node] = min(best[node], prio)
+
+        # BFS for failure links; fold each node's output chain into a single
+        # "best priority" so the scan never has to follow output links.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        i = 0
+        while i < len(queue):
+            node = queue[i]
+            i += 1
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                best[nxt] = min(best[nxt], best[fail[nxt]])
+                queue.append(nxt)
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+        return self
+
+    def match(self, text):
+        if self._goto is None:
+            self.compile()
+        found = self.exact.get(text, len(self.rules))
+        goto, fail, best = self._goto, self._fail, self._best
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if best[node] < found:
+                found = best[node]
+        if found >= len(self.rules):
+            return None
+        return self.rules[found]
+
+def build_default_matcher():
+    matcher = IntentMatcher()
+    for phrase in CONVO_MAP:
+        matcher.add_exact(phrase, "convo", phrase)
+    for keyword in HOW_ARE_KEYWORDS:
+        matcher.add_keyword(keyword, "convo", "how are you")
+    for phrase in RIDDLE_TRIGGERS:
+        matcher.add_exact(phrase, "riddle")
+    matcher.add_exact("skip", "skip")
+    for keyword in JOKE_KEYWORDS:
+        matcher.add_keyword(keyword, "joke")
+    for keyword in FACT_KEYWORDS:
+        matcher.add_keyword(keyword, "fact")
+    return matcher.compile()
+
+# ---------------------------
+# Indexed content store
+# ---------------------------
+_INDEX_MAGIC = b"CHATIDX1"
+_INDEX_HEADER = struct.Struct("<8s?3xQQQ")  # magic, little-endian flag, mtime_ns, size, count
+_INDEX_CHUNK = 65536
+
+def _iter_line_starts(mm, start, end):
+    # offsets of non-blank lines beginning in mm[start:end]; a partial line at
+    # `start` belongs to the previous line and is skipped
+    pos = start
+    if pos > 0 and mm[pos - 1:pos] != b"\n":
+        nl = mm.find(b"\n", pos, end)
+        pos = end if nl < 0 else nl + 1
+    n = len(mm)
+    while pos < end:
+        nl = mm.find(b"\n", pos)
+        if nl < 0:
+            nl = n
+        if mm[pos:nl].strip():
+            yield pos
+        pos = nl + 1
+
+class ContentStore:
+    # Read-only view of a one-entry-per-line text file. A uint64 offset of
+    # every non-blank line is kept in `<file>.idx` (rebuilt when the file's
+    # mtime or size changes), and both files are memory-mapped, so opening and
+    # random access cost the same whatever the corpus size. Behaves like a
+    # sequence, so random.choice(store) works. Additions go through a
+    # ContentAppender and are readable straight away, before they are committed.
+    def __init__(self, filepath, default_list=(), commit_interval=APPEND_COMMIT_INTERVAL):
+        self.filepath = filepath
+        self.index_path = filepath + INDEX_SUFFIX
+        self._default = list(default_list)
+        self._fallback = None
+        self._data = None
+        self._data_mm = None
+        self._index_mm = None
+        self._offsets = ()
+        # (offsets committed since the index was mapped, texts not committed yet);
+        # replaced as a whole so readers always see a consistent pair
+        self._tail = (array("Q"), [])
+        self._known_size = 0        # bytes of the file covered by the index + tail
+        self._lock = threading.Lock()
+        self.open()
+        self.appender = ContentAppender(filepath, commit_interval, existing=self, on_commit=self._on_commit)
+
+    def open(self):
+        self.close()
+        try:
+            if not os.path.exists(self.filepath) or os.path.getsize(self.filepath) == 0:
+                with open(self.filepath, "w", encoding="utf-8") as f:
+                    f.write("".join(line + "\n" for line in self._default))
+            self._data = open(self.filepath, "rb")
+            st = os.fstat(self._data.fileno())
+            self._known_size = st.st_size
+            if st.st_size:
+                self._data_mm = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            self._offsets = self._load_index(st)
+            if not len(self._offsets):
+                self._fallback = list(self._default)
+        except Exception as e:
+            print(f"[File read error] {self.filepath}: {e}", file=sys.stderr)
+            self.close()
+            self._fallback = list(self._default)
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._offsets = ()
+        self._tail = (array("Q"), [])
+        self._fallback = None
+        for res in (self._index_mm, self._data_mm, self._data):
+            if res is not None:
+                res.close()
+        self._index_mm = self._data_mm = self._data = None
+
+    def __len__(self):
+        extra, pending = self._tail
+        if self._fallback is not None:
+            return len(self._fallback) + len(pending)
+        return len(self._offsets) + len(extra) + len(pending)
+
+    def __getitem__(self, i):
+        extra, pending = self._tail
+        base = len(self._fallback) if self._fallback is not None else len(self._offsets) + len(extra)
+        n = base + len(pending)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("content index out of range")
+        if i >= base:
+            return pending[i - base]
+        if self._fallback is not None:
+            return self._fallback[i]
+        start = self._offsets[i] if i < len(self._offsets) else extra[i - len(self._offsets)]
+        mm = self._data_mm
+        end = mm.find(b"\n", start)
+        if end < 0:
+            end = len(mm)
+        return mm[start:end].decode("utf-8", errors="replace").strip()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def random_line(self, rng=random):
+        return self[rng.randrange(len(self))] if len(self) else None
+
+    def append(self, text):
+        # False when the text is empty or already present
+        with self._lock:
+            text = self.appender.add(text)
+            if text is None:
+                return False
+            self._tail[1].append(text)  # only ever grows under readers
+        return True
+
+    def extend(self, texts):
+        return sum(1 for text in texts if self.append(text))
+
+    def flush(self):
+        self.appender.flush()
+
+    def refresh(self):
+        # Pick up lines someone else appended, reading only the new tail.
+        # Returns False when the file was truncated or replaced and the
+        # store has to be reloaded from scratch.
+        try:
+            st = os.stat(self.filepath)
+        except OSError:
+            return True  # gone for now: keep serving what we have
+        with self._lock:
+            if self._data is None or self._fallback is not None:
+                return False
+            own = os.fstat(self._data.fileno())
+            if (st.st_ino, st.st_dev) != (own.st_ino, own.st_dev) or st.st_size < self._known_size:
+                return False
+            if st.st_size == self._known_size:
+                return True
+            mm = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            offsets = list(_iter_line_starts(mm, self._known_size, len(mm)))
+            self._swap_in(mm, offsets, 0, len(mm))
+        return True
+
+    def _on_commit(self, texts, offsets):
+        with self._lock:
+            if self._fallback is not None:
+                pending = self._tail[1][len(texts):]
+                self.open()
+                self._tail = (self._tail[0], pending)
+                return
+            mm = mmap.mmap(self._data.fileno(), 0, access=mmap.ACCESS_READ)
+            # lines appended by someone else just before our batch; a refresh
+            # that ran between our write and now may have indexed it already
+            known = self._known_size
+            gap = list(_iter_line_starts(mm, known, offsets[0])) if offsets[0] > known else []
+            end = offsets[-1] + len(texts[-1].encode("utf-8")) + 1
+            new = gap + [o for o in offsets if o >= known]
+            self._swap_in(mm, new, len(texts), max(end, known))
+
+    def _swap_in(self, mm, offsets, committed, known_size):
+        # map the grown file and swap it in; readers still holding the
+        # old mapping finish with it and it is freed with them
+        self._data_mm = mm
+        extra, pending = self._tail
+        if offsets:
+            extra = array("Q", extra)
+            extra.extend(offsets)
+        self._tail = (extra, pending[committed:] if committed else pending)
+        covered = self._known_size
+        self._known_size = known_size
+        if offsets:
+            self._append_to_index(offsets, covered)
+
+    # -- index file --
+    def _load_index(self, st):
+        try:
+            with open(self.index_path, "rb") as f:
+                header = f.read(_INDEX_HEADER.size)
+            if len(header) == _INDEX_HEADER.size:
+                magic, little, mtime_ns, size, count = _INDEX_HEADER.unpack(header)
+                if (magic == _INDEX_MAGIC and little == (sys.byteorder == "little")
+                        and mtime_ns == st.st_mtime_ns and size == st.st_size):
+                    return self._map_index(count)
+        except OSError:
+            pass
+        return self._build_index(st)
+
+    def _map_index(self, count):
+        if not count:
+            return ()
+        with open(self.index_path, "rb") as f:
+            self._index_mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._index_mm)[_INDEX_HEADER.size:_INDEX_HEADER.size + 8 * count]
+        return view.cast("Q")
+
+    def _build_index(self, st):
+        mm = self._data_mm
+        tmp_path = self.index_path + ".tmp"
+        count = 0
+        try:
+            out = open(tmp_path, "wb")
+        except OSError:
+            out = None  # read-only location: keep the index in memory
+        chunk = array("Q")
+        offsets = array("Q") if out is None else None
+        n = len(mm) if mm is not None else 0
+        if out is not None:
+            out.write(b"\0" * _INDEX_HEADER.size)
+        for pos in _iter_line_starts(mm, 0, n):
+            chunk.append(pos)
+            if len(chunk) >= _INDEX_CHUNK:
+                count += len(chunk)
+                if out is not None:
+                    chunk.tofile(out)
+                else:
+                    offsets.extend(chunk)
+                chunk = array("Q")
+        count += len(chunk)
+        if out is None:
+            offsets.extend(chunk)
+            return offsets
+        chunk.tofile(out)
+        out.seek(0)
+        out.write(_INDEX_HEADER.pack(_INDEX_MAGIC, sys.byteorder == "little", st.st_mtime_ns, st.st_size, count))
+        out.close()
+        os.replace(tmp_path, self.index_path)
+        return self._map_index(count)
+
+    def _append_to_index(self, offsets, covered):
+        # Keep the cached index valid so the next start does not rescan.
+        # Compare-and-append: other stores following the same file (GUI,
+        # chat_server workers) see the same new lines, so only the one whose
+        # index still ends at `covered` (the file size it indexed up to)
+        # appends them; the others find the header already moved on.
+        try:
+            st = os.stat(self.filepath)
+            # only vouch for the file if nothing unindexed follows our tail
+            mtime_ns = st.st_mtime_ns if st.st_size == self._known_size else 0
+            with open(self.index_path, "r+b") as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)  # released on close
+                header = f.read(_INDEX_HEADER.size)
+                magic, little, _, size, count = _INDEX_HEADER.unpack(header)
+                if magic != _INDEX_MAGIC or size != covered:
+                    return
+                f.seek(_INDEX_HEADER.size + 8 * count)
+                array("Q", offsets).tofile(f)
+                f.seek(0)
+                f.write(_INDEX_HEADER.pack(magic, little, mtime_ns, self._known_size, count + len(offsets)))
+        except (OSError, struct.error):
+            pass
+
+# ---------------------------
+# Content hot reload
+# ---------------------------
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+def _open_inotify(directories):
+    # Linux only; returns (fd, {wd: directory}) or None
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        if fd < 0:
+            return None
+        mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+        watches = {}
+        for d in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(d), mask)
+            if wd >= 0:
+                watches[wd] = d
+        if not watches:
+            os.close(fd)
+            return None
+        return fd, watches
+    except (OSError, AttributeError):
+        return None
+
+class ContentWatcher:
+    # Keeps the core's content stores in step with their files on disk: new
+    # lines appended by another process are indexed incrementally, and a
+    # truncated or replaced file is loaded into a fresh store that is swapped
+    # onto the core in one attribute assignment. Readers never wait on it.
+    def __init__(self, core, targets=None, interval=CONTENT_POLL_INTERVAL):
+        self.core = core
+        self.targets = targets or {"jokes": (JOKES_FILE, DEFAULT_JOKES), "facts": (FACTS_FILE, DEFAULT_FACTS)}
+        self.interval = interval
+        self.using_inotify = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="content-watch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self, attr):
+        path, default = self.targets[attr]
+        store = getattr(self.core, attr)
+        if isinstance(store, ContentStore) and store.refresh():
+            return
+        if not os.path.exists(path):
+            return
+        if isinstance(store, ContentStore):
+            store.flush()
+        setattr(self.core, attr, ContentStore(path, default))
+
+    def check_all(self):
+        for attr in self.targets:
+            try:
+                self.check(attr)
+            except Exception as e:
+                print(f"[Content reload error] {attr}: {e}", file=sys.stderr)
+
+    def _run(self):
+        dirs = {os.path.dirname(os.path.abspath(path)) for path, _ in self.targets.values()}
+        inotify = _open_inotify(dirs)
+        if inotify is None:
+            while not self._stop.wait(self.interval):
+                self.check_all()
+            return
+        self.using_inotify = True
+        fd, watches = inotify
+        names = {}
+        for attr, (path, _) in self.targets.items():
+            full = os.path.abspath(path)
+            names[(os.path.dirname(full), os.path.basename(full))] = attr
+        import select
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], self.interval)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                changed = set()
+                pos = 0
+                while pos + _INOTIFY_EVENT.size <= len(data):
+                    wd, mask, cookie, length = _INOTIFY_EVENT.unpack_from(data, pos)
+                    pos += _INOTIFY_EVENT.size
+                    name = data[pos:pos + length].rstrip(b"\0").decode(errors="replace")
+                    pos += length
+                    attr = names.get((watches.get(wd), name))
+                    if attr:
+                        changed.add(attr)
+                for attr in changed:
+                    try:
+                        self.check(attr)
+                    except Exception as e:
+                        print(f"[Content reload error] {attr}: {e}", file=sys.stderr)
+        finally:
+            os.close(fd)
+
 # ---------------------------
 # Safe TTS wrapper (pyttsx3)
 # ---------------------------
+def _pyttsx3_engine(rate):
+    with STARTUP.measure("import pyttsx3"):
+        import pyttsx3
+    with STARTUP.measure("pyttsx3.init"):
+        engine = pyttsx3.init()
+    try:
+        engine.setProperty('rate', rate)
+    except Exception:
+        pass
+    return engine
+
+class _WinsoundPlayer:
+    def __init__(self):
+        import winsound
+        self._winsound = winsound
+
+    def play(self, path):
+        self._winsound.PlaySound(path, self._winsound.SND_FILENAME | self._winsound.SND_NODEFAULT)
+
+    def stop(self):
+        self._winsound.PlaySound(None, 0)
+
+def _default_player():
+    try:
+        return _WinsoundPlayer()
+    except ImportError:
+        return None
+
 class SafeTTS:
-    def __init__(self, enabled=True, rate=VOICE_RATE):
+    # One long-lived worker owns the engine (pyttsx3 drivers want to be used
+    # from the thread that created them) and speaks from a bounded queue.
+    # speak() interrupts what is playing unless told otherwise, so stale
+    # replies are dropped instead of piling up. Repeated replies are rendered
+    # to wav once and replayed when a player is available.
+    # engine_factory(rate) and player (play(path)/stop()) can be swapped for
+    # stand-ins, e.g. in tests.
+    # With autostart=False nothing is imported or initialised until start()
+    # (or set_enabled) is called; speak() just queues until then.
+    def __init__(self, enabled=True, rate=VOICE_RATE, engine_factory=None, player=None,
+                 queue_size=TTS_QUEUE_SIZE, cache_dir=TTS_CACHE_DIR, autostart=True):
         self.enabled = enabled
         self.engine = None
         self.rate = rate
+        self.failed = False
+        self._engine_factory = engine_factory or _pyttsx3_engine
+        self._player = player
+        self._cache_dir = cache_dir
+        self._cache = {}
+        self._seen = {}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._speaking = None
+        self._worker = None
+        self.ready = threading.Event()
+        if enabled and autostart:
+            self.start()
+
+    def start(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self.failed = False
+        self.ready.clear()
+        self._worker = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._worker.start()
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
         if not enabled:
+            self.cancel()
+        else:
+            self.start()
+
+    @METRICS.timed("chatbot_tts_speak_seconds")
+    def speak(self, text, interrupt=True):
+        if not self.enabled or self.failed:
             return
+        with self._lock:
+            if interrupt:
+                self._cancel_locked()
+            elif self._speaking == (self._generation, text):
+                return
+            item = (self._generation, text)
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+                METRICS.inc("chatbot_tts_dropped_total")
+                self._queue.put_nowait(item)
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+
+    def close(self):
+        self.cancel()
+        if self._worker is not None:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def _cancel_locked(self):
+        self._generation += 1
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        if self._speaking is not None and self._player is not None:
+            try:
+                self._player.stop()
+            except Exception:
+                pass
+
+    def _on_word(self, *args, **kwargs):
+        # engine callback on the worker thread: stop if the utterance went stale
+        speaking = self._speaking
+        if speaking is not None and speaking[0] != self._generation:
+            self.engine.stop()
+
+    def _run(self):
         try:
-            import pyttsx3
-            self.engine = pyttsx3.init()
+            with STARTUP.measure("tts engine"):
+                self.engine = self._engine_factory(self.rate)
+                if self._player is None:
+                    self._player = _default_player()
             try:
-                self.engine.setProperty('rate', rate)
+                self.engine.connect('started-word', self._on_word)
             except Exception:
                 pass
         except Exception as e:
             print(f"[TTS init failed] pyttsx3 not available or error: {e}", file=sys.stderr)
             self.engine = None
             self.enabled = False
-
-    def speak(self, text):
-        if not self.enabled or not self.engine:
+            self.failed = True
             return
-        def _run():
+        finally:
+            self.ready.set()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if item[0] != self._generation:
+                continue
+            self._speaking = item
             try:
-                self.engine.say(text)
-                self.engine.runAndWait()
+                self._say(item[1])
             except Exception as e:
                 print(f"[TTS error] {e}", file=sys.stderr)
-        threading.Thread(target=_run, daemon=True).start()
+            finally:
+                self._speaking = None
+
+    def _say(self, text):
+        path = self._cached_audio(text)
+        if path:
+            self._player.play(path)
+            return
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+    def _cached_audio(self, text):
+        if self._player is None or not self._cache_dir:
+            return None
+        path = self._cache.get(text)
+        if path and os.path.exists(path):
+            return path
+        count = self._seen.get(text, 0) + 1
+        if len(self._seen) > 16 * TTS_CACHE_MAX:
+            self._seen.clear()
+        self._seen[text] = count
+        if count < TTS_CACHE_AFTER or len(self._cache) >= TTS_CACHE_MAX:
+            return None
+        os.makedirs(self._cache_dir, exist_ok=True)
+        key = hashlib.sha1(f"{self.rate}:{text}".encode("utf-8")).hexdigest()
+        path = os.path.join(self._cache_dir, key + ".wav")
+        if not os.path.exists(path):
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+        if not os.path.exists(path):
+            return None
+        self._cache[text] = path
+        return path
 
 # ---------------------------
-# Chatbot core logic
+# Riddle bank & answer matching
 # ---------------------------
-class ChatbotCore:
+_ANSWER_FILLER = frozenset(("a", "an", "the", "it", "its", "it's", "is", "i", "think", "am", "you", "are", "maybe"))
+
+def normalize_answer(text):
+    # lowercase, punctuation to spaces, drop articles and filler words
+    text = "".join(ch if ch.isalnum() or ch == "'" else " " for ch in text.lower())
+    words = [w.strip("'") for w in text.split()]
+    kept = [w for w in words if w and w not in _ANSWER_FILLER]
+    return " ".join(kept or [w for w in words if w])
+
+def answer_tolerance(answer):
+    # typos forgiven for an answer of this length; one letter changes too
+    # many short words into other words ("lead" -> "head", "read", "leaf")
+    n = len(answer)
+    return 0 if n <= 5 else 1 if n <= 8 else 2
+
+def bounded_levenshtein(a, b, limit):
+    # Edit distance if it is <= limit, else limit + 1. Only the diagonal band
+    # of width 2*limit+1 is computed and it stops as soon as the band is
+    # entirely over the limit, so cost is O(limit * len) at worst.
+    if a == b:
+        return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > limit:
+        return limit + 1
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    big = limit + 1
+    prev = [j if j <= limit else big for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        lo = max(1, i - limit)
+        hi = min(lb, i + limit)
+        cur = [big] * (lb + 1)
+        if i <= limit:
+            cur[0] = i
+        ca = a[i - 1]
+        best = cur[0] if lo == 1 else big
+        for j in range(lo, hi + 1):
+            cost = 0 if ca == b[j - 1] else 1
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            cur[j] = v if v < big else big
+            if cur[j] < best:
+                best = cur[j]
+        if best > limit:
+            return big
+        prev = cur
+    return prev[lb] if prev[lb] <= limit else big
+
+class RiddleBank:
+    # Riddles plus a precomputed index of their normalised accepted answers
+    # (main answer + synonyms), grouped by word count so a check only looks
+    # at same-length windows of the user's reply. Behaves like a sequence of
+    # the riddle dicts, so random.choice(bank) works.
+    def __init__(self, riddles=RIDDLES):
+        self.riddles = []
+        self._answers = []   # per riddle: {word count: [(normalised answer, tolerance)]}
+        for r in riddles:
+            self.add(r["q"], r["a"], r.get("alts", ()))
+
+    @classmethod
+    def load(cls, filepath=RIDDLES_FILE, default=RIDDLES):
+        try:
+            if not os.path.exists(filepath):
+                with open(filepath, "w", encoding="utf-8") as f:
+                    for r in default:
+                        f.write(f"{r['q']} | {r['a'].strip()} | {'; '.join(r.get('alts', ()))}\n")
+                return cls(default)
+            bank = cls(())
+            with open(filepath, "r", encoding="utf-8") as f:
+                for lineno, line in enumerate(f, start=1):
+                    parts = [p.strip() for p in line.split("|")]
+                    if len(parts) < 2 or not parts[0] or not parts[1]:
+                        if line.strip():
+                            print(f"[Riddle file] {filepath}:{lineno}: expected 'question | answer'", file=sys.stderr)
+                        continue
+                    alts = [a.strip() for a in (parts[2].split(";") if len(parts) > 2 else ())]
+                    alts = [a for a in alts if a]
+                    bank.add(parts[0], parts[1], alts)
+            return bank if len(bank) else cls(default)
+        except Exception as e:
+            print(f"[File read error] {filepath}: {e}", file=sys.stderr)
+            return cls(default)
+
+    def __len__(self):
+        return len(self.riddles)
+
+    def __getitem__(self, i):
+        return self.riddles[i]
+
+    def add(self, question, answer, alts=()):
+        riddle = {"id": len(self.riddles), "q": question, "a": answer, "alts": list(alts)}
+        index = {}
+        for accepted in [answer, *alts]:
+            norm = normalize_answer(accepted)
+            if norm:
+                entry = (norm, answer_tolerance(norm))
+                index.setdefault(norm.count(" ") + 1, [])
+                if entry not in index[norm.count(" ") + 1]:
+                    index[norm.count(" ") + 1].append(entry)
+        self.riddles.append(riddle)
+        self._answers.append(index)
+        return riddle
+
+    def check(self, riddle, user_answer):
+        rid = riddle.get("id")
+        if rid is None or rid >= len(self._answers) or self.riddles[rid] is not riddle:
+            # a riddle from elsewhere (e.g. a bank that has since been reloaded)
+            index = RiddleBank([riddle])._answers[0]
+        else:
+            index = self._answers[rid]
+        words = normalize_answer(user_answer).split()
+        if not words:
+            return False
+        for size, accepted in index.items():
+            if size > len(words):
+                continue
+            windows = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+            for norm, tolerance in accepted:
+                for window in windows:
+                    if window == norm:
+                        return True
+                    # a typo is forgiven, a different first letter is not
+                    if tolerance and window[0] == norm[0] and bounded_levenshtein(window, norm, tolerance) <= tolerance:
+                        return True
+        return False
+
+# ---------------------------
+# Content sampling
+# ---------------------------
+class ShuffleState:
+    # Per-session position in a shuffled pass over one corpus. The shuffle is
+    # a keyed permutation computed on the fly, so the state is a few ints
+    # however large the corpus is (weighted sampling adds a small ring of
+    # recent ids).
+    __slots__ = ("size", "key", "pos", "recent")
+
+    def __init__(self):
+        self.size = 0
+        self.key = 0
+        self.pos = 0
+        self.recent = None
+
+def _permute(x, key, half_bits):
+    # 4-round Feistel network over 2*half_bits bits: a bijection for each key
+    mask = (1 << half_bits) - 1
+    left, right = x >> half_bits, x & mask
+    for r in range(4):
+        k = (key >> (16 * r)) & 0xFFFF
+        f = ((right * 0x9E3779B1) ^ (k * 0x85EBCA6B) ^ r) & 0xFFFFFFFF
+        f = ((f ^ (f >> 15)) * 0x2C1B3C6D) & 0xFFFFFFFF
+        left, right = right, left ^ (f & mask)
+    return (left << half_bits) | right
+
+def shuffled_index(pos, n, key):
+    # pos-th element of a pseudo-random permutation of range(n); the domain
+    # is at most 4n so cycle-walking takes under 4 steps on average
+    half_bits = max(1, ((n - 1).bit_length() + 1) // 2)
+    x = _permute(pos, key, half_bits)
+    while x >= n:
+        x = _permute(x, key, half_bits)
+    return x
+
+class AliasTable:
+    # Vose's alias method: O(n) build, O(1) weighted draws, 12 bytes per item
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("weights must contain a positive value")
+        self.prob = array("d", [0.0]) * n
+        self.alias = array("I", [0]) * n
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, g = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            (small if scaled[g] < 1.0 else large).append(g)
+        for i in large + small:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def __len__(self):
+        return len(self.prob)
+
+    def draw(self, rng=random):
+        i = rng.randrange(len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+class ContentSampler:
+    # Hands out content ids per session without repeats. Unweighted corpora
+    # are walked in a per-session shuffled order (every item once per pass);
+    # weighted ones draw from a shared alias table and re-draw ids the session
+    # saw recently (a window capped at a quarter of the corpus). Items added
+    # to the corpus join from the next pass.
+    def __init__(self, weights=None, recent=SAMPLER_RECENT):
+        self.table = AliasTable(weights) if weights is not None else None
+        self.recent = recent
+
+    def draw(self, n, state, rng=random):
+        if n <= 0:
+            return None
+        if n == 1:
+            return 0
+        if self.table is not None and len(self.table) == n:
+            return self._draw_weighted(n, state, rng)
+        # a grown corpus is picked up when the current pass ends; a shrunk
+        # one (reloaded file) starts over, as old ids may be past its end
+        if state.pos >= state.size or n < state.size:
+            state.size = n
+            state.key = rng.getrandbits(64)
+            state.pos = 0
+        # the pass keeps the size it started with: ids past it wait for the next
+        i = shuffled_index(state.pos, state.size, state.key)
+        state.pos += 1
+        return i
+
+    def _draw_weighted(self, n, state, rng):
+        # the window is at most a quarter of the corpus: avoiding nearly every
+        # id (n - 1 of them) would turn a small corpus into a round-robin and
+        # flatten its weights. Corpora under 4 items are drawn by weight alone.
+        keep = min(self.recent, n // 4)
+        if keep == 0:
+            return self.table.draw(rng)
+        if state.recent is None:
+            state.recent = array("I")
+        recent = state.recent
+        i = self.table.draw(rng)
+        for _ in range(8):
+            if i not in recent:
+                break
+            i = self.table.draw(rng)
+        recent.append(i)
+        if len(recent) > keep:
+            del recent[0]
+        return i
+
+# ---------------------------
+# Fact retrieval (BM25)
+# ---------------------------
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""a an and are as at be but by can do does for from have how i if in is it its me
+my of on or so that the their there they this to was what when where which who why will with you your""".split())
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+class _Bm25State:
+    __slots__ = ("terms", "docs", "tfs", "doc_len", "total_len")
+
     def __init__(self):
-        self.jokes = safe_read_lines(JOKES_FILE, DEFAULT_JOKES)
-        self.facts = safe_read_lines(FACTS_FILE, DEFAULT_FACTS)
+        self.terms = {}            # term -> term id
+        self.docs = []             # term id -> array of doc ids (ascending)
+        self.tfs = []              # term id -> array of term frequencies
+        self.doc_len = array("I")
+        self.total_len = 0
+
+    @property
+    def count(self):
+        return len(self.doc_len)
+
+    def add(self, text):
+        doc = len(self.doc_len)
+        counts = {}
+        tokens = tokenize(text)
+        for t in tokens:
+            counts[t] = counts.get(t, 0) + 1
+        for t, tf in counts.items():
+            tid = self.terms.get(t)
+            if tid is None:
+                tid = self.terms[t] = len(self.docs)
+                self.docs.append(array("I"))
+                self.tfs.append(array("H"))
+            self.tfs[tid].append(min(tf, 0xFFFF))
+            self.docs[tid].append(doc)
+        self.doc_len.append(len(tokens))
+        self.total_len += len(tokens)
+
+class FactIndex:
+    # BM25 inverted index over a fact corpus, with postings kept in typed
+    # arrays. Queries walk the postings of rare terms and only look up the
+    # docs they found in the postings of common ones (binary search), so a
+    # query costs about the same at 1M facts as at 1k. sync(corpus) indexes
+    # whatever was appended since last time: small increments inline, large
+    # ones (or a swapped-in corpus) on a background thread while the previous
+    # index keeps answering.
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._state = _Bm25State()
+        self._source = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def __len__(self):
+        return self._state.count
+
+    def wait(self, timeout=None):
+        # blocks until a background build has been swapped in
+        return self._idle.wait(timeout)
+
+    def sync(self, corpus):
+        with self._lock:
+            if self._building:
+                return
+            fresh = corpus is not self._source
+            state = _Bm25State() if fresh else self._state
+            missing = len(corpus) - state.count
+            if missing <= 0 and not fresh:
+                return
+            if missing <= BM25_INLINE_SYNC:
+                for i in range(state.count, len(corpus)):
+                    state.add(corpus[i])
+                self._state, self._source = state, corpus
+                return
+            self._building = True
+            self._idle.clear()
+        threading.Thread(target=self._build, args=(state, corpus, fresh), name="fact-index", daemon=True).start()
+
+    def _build(self, state, corpus, fresh):
+        try:
+            with STARTUP.measure("fact index"):
+                pos = state.count
+                while pos < len(corpus):
+                    end = min(len(corpus), pos + BM25_INLINE_SYNC)
+                    if fresh:
+                        for i in range(pos, end):
+                            state.add(corpus[i])
+                    else:
+                        with self._lock:
+                            for i in range(pos, end):
+                                state.add(corpus[i])
+                    pos = end
+            with self._lock:
+                self._state, self._source = state, corpus
+        except Exception as e:
+            print(f"[Fact index error] {e}", file=sys.stderr)
+        finally:
+            self._building = False
+            self._idle.set()
+
+    def search(self, query, min_score=BM25_MIN_SCORE):
+        # best (text, score) for the query, or None
+        with self._lock:
+            state, source = self._state, self._source
+            n = state.count
+            if not n:
+                return None
+            avgdl = state.total_len / n or 1.0
+            k1, b = self.k1, self.b
+            doc_len = state.doc_len
+            tids = [state.terms[t] for t in set(tokenize(query)) if t in state.terms]
+            tids.sort(key=lambda tid: len(state.docs[tid]))
+            scores = {}
+            for tid in tids:
+                docs, tfs = state.docs[tid], state.tfs[tid]
+                df = len(docs)
+                if df > BM25_MAX_DF * n and n > 1 / BM25_MAX_DF:
+                    continue
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                if df <= BM25_MAX_POSTINGS:
+                    positions = range(df)
+                elif scores:
+                    positions = []
+                    for d in list(scores):
+                        j = bisect.bisect_left(docs, d)
+                        if j < df and docs[j] == d:
+                            positions.append(j)
+                else:
+                    # only common terms: settle for the newest facts
+                    positions = range(df - BM25_MAX_POSTINGS, df)
+                for j in positions:
+                    d = docs[j]
+                    tf = tfs[j]
+                    s = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len[d] / avgdl))
+                    scores[d] = scores.get(d, 0.0) + s
+            if not scores:
+                return None
+            best = max(scores, key=scores.get)
+            if scores[best] < min_score:
+                return None
+            return source[best], scores[best]
+
+# ---------------------------
+# Conversation sessions
+# ---------------------------
+class ChatSession:
+    __slots__ = ("session_id", "current_riddle", "riddle_active", "last_seen", "bags")
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id
         self.current_riddle = None
         self.riddle_active = True
         #self.riddle_active = False
+        self.last_seen = time.monotonic()
+        self.bags = None
 
-    def get_reply(self, user_text):
-        meta = {}
-        text = user_text.strip().lower()
+    def bag(self, kind):
+        if self.bags is None:
+            self.bags = {}
+        state = self.bags.get(kind)
+        if state is None:
+            state = self.bags[kind] = ShuffleState()
+        return state
 
-        if self.riddle_active and self.current_riddle:
-            expected = self.current_riddle["a"].strip().lower()
+    def stop_riddle(self):
+        self.current_riddle = None
+        self.riddle_active = False
+
+class SessionStore:
+    # Bounded LRU of sessions with an idle TTL. Thread-safe so one core can be
+    # shared by the GUI worker, the batch pipeline and the server.
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self.ttl and now - session.last_seen > self.ttl:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions[session_id] = session
+                self._evict(now)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_seen = now
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _evict(self, now):
+        sessions = self._sessions
+        while len(sessions) > self.max_sessions:
+            sessions.popitem(last=False)
+        if self.ttl:
+            while sessions:
+                oldest = next(iter(sessions.values()))
+                if now - oldest.last_seen <= self.ttl:
+                    break
+                sessions.popitem(last=False)
+
+# ---------------------------
+# Reply cache
+# ---------------------------
+class ReplyCache:
+    # Thread-safe LRU of (value, version) keyed by normalised text plus
+    # whatever session state changes the answer. An entry whose version no
+    # longer matches (e.g. a retrieved fact after the corpus changed) is a miss.
+    def __init__(self, maxsize=REPLY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] != version):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, version=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+# ---------------------------
+# Transcript log
+# ---------------------------
+# <log>:      "CHATLOG1" then records of
+#             [body length u32][crc32 of time+body u32][unix time f64][body]
+#             body = [session, sender, text, intent byte lengths <HHIH][utf-8 bytes...]
+# <log>.idx:  "CHATCKP1" then one (time, offset, record number) checkpoint
+#             every LOG_CHECKPOINT_EVERY records, so reads only scan from the
+#             nearest checkpoint. It is rebuilt from the log when missing.
+_LOG_MAGIC = b"CHATLOG1"
+_CKP_MAGIC = b"CHATCKP1"
+_LOG_HEAD = struct.Struct("<IId")
+_LOG_FIELDS = struct.Struct("<HHIH")
+_LOG_CHECKPOINT = struct.Struct("<dQQ")
+
+def _encode_turn(ts, session, sender, text, intent):
+    session = session.encode("utf-8")[:0xFFFF]
+    sender = sender.encode("utf-8")[:0xFFFF]
+    text = text.encode("utf-8")[:0xFFFFFFFF]
+    intent = intent.encode("utf-8")[:0xFFFF]
+    body = _LOG_FIELDS.pack(len(session), len(sender), len(text), len(intent)) + session + sender + text + intent
+    stamp = struct.pack("<d", ts)
+    return struct.pack("<II", len(body), zlib.crc32(body, zlib.crc32(stamp))) + stamp + body
+
+def _decode_turn(ts, body):
+    # -> (time, session, sender, text, intent)
+    sizes = _LOG_FIELDS.unpack_from(body)
+    fields = []
+    pos = _LOG_FIELDS.size
+    for size in sizes:
+        fields.append(body[pos:pos + size].decode("utf-8", errors="replace"))
+        pos += size
+    return (ts, *fields)
+
+class TranscriptLog:
+    # Append-only log of conversation turns. record() only buffers; a
+    # background thread group-commits the buffer every `interval` seconds
+    # (same scheme as ContentAppender), so logging never waits on the disk.
+    # Timestamps are kept non-decreasing, which is what lets between() bisect
+    # the checkpoints. One process writes a given log.
+    def __init__(self, filepath=TRANSCRIPT_LOG_FILE, interval=LOG_COMMIT_INTERVAL,
+                 checkpoint_every=LOG_CHECKPOINT_EVERY):
+        self.filepath = filepath
+        self.index_path = filepath + INDEX_SUFFIX
+        self.interval = interval
+        self.checkpoint_every = checkpoint_every
+        self.failed = False
+        self._buffer = []
+        self._last_ts = 0.0
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._opened = False
+        self._end = 0
+        self._count = 0
+        self._checkpoints = []
+
+    def __len__(self):
+        with self._commit_lock:
+            self._open()
+            return self._count + len(self._buffer)
+
+    def record(self, session, sender, text, intent="", ts=None):
+        with self._lock:
+            ts = max(time.time() if ts is None else ts, self._last_ts)
+            self._last_ts = ts
+            self._buffer.append((ts, session or "", sender, text, intent or ""))
+            self._ensure_thread()
+
+    def record_turn(self, session, user_text, reply, intent):
+        with self._lock:
+            ts = max(time.time(), self._last_ts)
+            self._last_ts = ts
+            self._buffer.append((ts, session or "", "user", user_text, intent))
+            self._buffer.append((ts, session or "", "bot", reply, intent))
+            self._ensure_thread()
+
+    def flush(self):
+        with self._commit_lock:
+            with self._lock:
+                batch = self._buffer
+                self._buffer = []
+            if not batch or self.failed:
+                return 0
+            try:
+                self._open()
+                if self.failed:
+                    return 0  # not a transcript log: logging is off, drop the batch
+                self._write(batch)
+            except OSError as e:
+                print(f"[Transcript log error] {self.filepath}: {e}", file=sys.stderr)
+                with self._lock:
+                    self._buffer[:0] = batch
+                return 0
+            return len(batch)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def tail(self, n):
+        # the last n turns, oldest first
+        self.flush()
+        with self._commit_lock:
+            self._open()
+            first = max(0, self._count - n)
+            k = bisect.bisect_right([cp[2] for cp in self._checkpoints], first) - 1
+            offset, recno = (self._checkpoints[k][1], self._checkpoints[k][2]) if k >= 0 else (len(_LOG_MAGIC), 0)
+            end = self._end
+        out = []
+        with open(self.filepath, "rb") as f:
+            for _, _, ts, body in self._scan(f, offset, end):
+                if recno >= first:
+                    out.append(_decode_turn(ts, body))
+                recno += 1
+        return out
+
+    def between(self, start_ts, end_ts=None):
+        # yields the turns with start_ts <= time <= end_ts
+        self.flush()
+        with self._commit_lock:
+            self._open()
+            k = bisect.bisect_left([cp[0] for cp in self._checkpoints], start_ts) - 1
+            offset = self._checkpoints[k][1] if k >= 0 else len(_LOG_MAGIC)
+            end = self._end
+        with open(self.filepath, "rb") as f:
+            for _, _, ts, body in self._scan(f, offset, end):
+                if end_ts is not None and ts > end_ts:
+                    return
+                if ts >= start_ts:
+                    yield _decode_turn(ts, body)
+
+    def compact(self, before_ts=None, keep_last=None):
+        # drops turns older than before_ts and/or all but the newest
+        # keep_last, rewriting the log and its checkpoints in place
+        self.flush()
+        with self._commit_lock:
+            self._open()
+            if self.failed:
+                return 0
+            first = 0 if keep_last is None else max(0, self._count - keep_last)
+            tmp = self.filepath + ".compact"
+            checkpoints = []
+            count = 0
+            recno = 0
+            with open(self.filepath, "rb") as src, open(tmp, "wb") as dst:
+                dst.write(_LOG_MAGIC)
+                for offset, stop, ts, body in self._scan(src, len(_LOG_MAGIC), self._end):
+                    recno += 1
+                    if recno <= first or (before_ts is not None and ts < before_ts):
+                        continue
+                    if count % self.checkpoint_every == 0:
+                        checkpoints.append((ts, dst.tell(), count))
+                    dst.write(_LOG_HEAD.pack(len(body), zlib.crc32(body, zlib.crc32(struct.pack("<d", ts))), ts))
+                    dst.write(body)
+                    count += 1
+                end = dst.tell()
+                dst.flush()
+                os.fsync(dst.fileno())
+            dropped = self._count - count
+            os.replace(tmp, self.filepath)
+            self._write_checkpoints(checkpoints)
+            self._end, self._count, self._checkpoints = end, count, checkpoints
+            return dropped
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="transcript-log", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+            if not self._buffer:
+                break  # idle: the next record() starts a new committer
+
+    def _scan(self, f, offset, end):
+        # yields (offset, next offset, time, body) for intact records
+        f.seek(offset)
+        while offset + _LOG_HEAD.size <= end:
+            head = f.read(_LOG_HEAD.size)
+            length, crc, ts = _LOG_HEAD.unpack(head)
+            stop = offset + _LOG_HEAD.size + length
+            if length < _LOG_FIELDS.size or stop > end:
+                return
+            body = f.read(length)
+            if len(body) != length or zlib.crc32(body, zlib.crc32(head[8:])) != crc:
+                return
+            yield offset, stop, ts, body
+            offset = stop
+
+    def _open(self):
+        # validate the log from the last good checkpoint and cut off a torn
+        # tail left by a crash; called with the commit lock held
+        if self._opened:
+            return
+        self._opened = True
+        try:
+            size = os.path.getsize(self.filepath)
+        except OSError:
+            size = 0
+        if size == 0:
+            with open(self.filepath, "wb") as f:
+                f.write(_LOG_MAGIC)
+            self._write_checkpoints([])
+            self._end = len(_LOG_MAGIC)
+            return
+        with open(self.filepath, "rb") as f:
+            if f.read(len(_LOG_MAGIC)) != _LOG_MAGIC:
+                self.failed = True
+                print(f"[Transcript log error] {self.filepath}: not a transcript log, logging disabled", file=sys.stderr)
+                return
+            checkpoints = self._read_checkpoints(f, size)
+            offset, recno = (checkpoints[-1][1], checkpoints[-1][2]) if checkpoints else (len(_LOG_MAGIC), 0)
+            rebuild = not checkpoints
+            end, last_ts = offset, 0.0
+            for start, stop, ts, _ in self._scan(f, offset, size):
+                if recno % self.checkpoint_every == 0 and (not checkpoints or checkpoints[-1][2] < recno):
+                    checkpoints.append((ts, start, recno))
+                    rebuild = True
+                recno += 1
+                end, last_ts = stop, ts
+        if end < size:
+            print(f"[Transcript log] {self.filepath}: dropped {size - end} bytes of an incomplete record", file=sys.stderr)
+            os.truncate(self.filepath, end)
+        if rebuild:
+            self._write_checkpoints(checkpoints)
+        self._end, self._count, self._checkpoints = end, recno, checkpoints
+        with self._lock:
+            self._last_ts = max(self._last_ts, last_ts)
+
+    def _read_checkpoints(self, f, size):
+        # checkpoints that still point at an intact record of this log
+        try:
+            with open(self.index_path, "rb") as idx:
+                data = idx.read()
+        except OSError:
+            return []
+        if not data.startswith(_CKP_MAGIC):
+            return []
+        usable = (len(data) - len(_CKP_MAGIC)) // _LOG_CHECKPOINT.size * _LOG_CHECKPOINT.size
+        checkpoints = list(_LOG_CHECKPOINT.iter_unpack(data[len(_CKP_MAGIC):len(_CKP_MAGIC) + usable]))
+        while checkpoints:
+            ts, offset, _ = checkpoints[-1]
+            hit = next(self._scan(f, offset, size), None)
+            if hit is not None and hit[2] == ts:
+                break
+            checkpoints.pop()
+        return checkpoints
+
+    def _write_checkpoints(self, checkpoints):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_CKP_MAGIC + b"".join(_LOG_CHECKPOINT.pack(*cp) for cp in checkpoints))
+        os.replace(tmp, self.index_path)
+
+    def _write(self, batch):
+        records = []
+        new_checkpoints = []
+        pos = self._end
+        recno = self._count
+        for turn in batch:
+            rec = _encode_turn(*turn)
+            if recno % self.checkpoint_every == 0:
+                new_checkpoints.append((turn[0], pos, recno))
+            records.append(rec)
+            pos += len(rec)
+            recno += 1
+        flags = os.O_WRONLY | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        fd = os.open(self.filepath, flags)
+        try:
+            data = memoryview(b"".join(records))
+            while data:
+                written = os.write(fd, data)
+                data = data[written:]
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._end, self._count = pos, recno
+        if new_checkpoints:
+            self._checkpoints.extend(new_checkpoints)
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(_LOG_CHECKPOINT.pack(*cp) for cp in new_checkpoints))
+
+# ---------------------------
+# Chatbot core logic
+# ---------------------------
+class ChatbotCore:
+    # lazy=True serves the built-in defaults until load_content() or
+    # load_content_async() swaps the files in and sets content_ready
+    # (content_failed instead if the background load raised).
+    def __init__(self, matcher=None, max_sessions=SESSION_MAX, session_ttl=SESSION_TTL, lazy=False,
+                 reply_cache_size=REPLY_CACHE_SIZE, transcript_log=None):
+        with STARTUP.measure("intent matcher"):
+            self.matcher = matcher or build_default_matcher()
+        self.jokes = list(DEFAULT_JOKES)
+        self.facts = list(DEFAULT_FACTS)
+        self.riddles = RiddleBank(RIDDLES)
+        self.samplers = {"jokes": ContentSampler(), "facts": ContentSampler(), "riddles": ContentSampler()}
+        self.fact_index = FactIndex()
+        self.reply_cache = ReplyCache(reply_cache_size)
+        self.transcript_log = transcript_log
+        self.content_ready = threading.Event()
+        self.content_failed = threading.Event()
+        self.watcher = None
+        self._closed = False
+        if not lazy:
+            self.load_content()
+        # the GUI talks through the default session; other front-ends look
+        # sessions up by id so one core can serve many conversations
+        self.default_session = ChatSession()
+        self.sessions = SessionStore(max_sessions, session_ttl)
+
+    def load_content(self):
+        with STARTUP.measure("content files"):
+            jokes = ContentStore(JOKES_FILE, DEFAULT_JOKES)
+            facts = ContentStore(FACTS_FILE, DEFAULT_FACTS)
+            riddles = RiddleBank.load(RIDDLES_FILE)
+        self.jokes, self.facts, self.riddles = jokes, facts, riddles
+        self.fact_index.sync(facts)
+        self.content_ready.set()
+
+    def close(self):
+        # safe to call twice (the GUI's exit handler, then main)
+        if self._closed:
+            return
+        self._closed = True
+        if self.watcher is not None:
+            self.watcher.stop()
+        # commit any buffered additions
+        for store in (self.jokes, self.facts):
+            if isinstance(store, ContentStore):
+                store.flush()
+        if self.transcript_log is not None:
+            self.transcript_log.close()
+
+    def load_content_async(self, watch=False):
+        def _load():
+            try:
+                self.load_content()
+            except Exception as e:
+                print(f"[Content load error] {e}", file=sys.stderr)
+                self.content_failed.set()
+                return
+            if watch:
+                self.start_watcher()
+        threading.Thread(target=_load, name="content", daemon=True).start()
+
+    def start_watcher(self, interval=CONTENT_POLL_INTERVAL):
+        if self.watcher is None:
+            self.watcher = ContentWatcher(self, interval=interval)
+        return self.watcher.start()
+
+    @property
+    def current_riddle(self):
+        return self.default_session.current_riddle
+
+    @property
+    def riddle_active(self):
+        return self.default_session.riddle_active
+
+    def session(self, session_id=None):
+        if session_id is None:
+            return self.default_session
+        return self.sessions.get(session_id)
+
+    def get_reply(self, user_text, session=None):
+        start = time.perf_counter() if METRICS.enabled else 0.0
+        reply, meta, intent, hit = self._get_reply(user_text, session)
+        if METRICS.enabled:
+            METRICS.inc("chatbot_replies_total", intent=intent)
+            METRICS.inc("chatbot_reply_cache_total", result="hit" if hit else "miss")
+            METRICS.observe("chatbot_reply_seconds", time.perf_counter() - start, intent=intent)
+        if self.transcript_log is not None:
+            state = session or self.default_session
+            self.transcript_log.record_turn(state.session_id, user_text, reply, intent)
+        return reply, meta
+
+    def _get_reply(self, user_text, session):
+        # returns (reply, meta, intent, served from cache)
+        text = user_text.strip().lower()
+        state = session or self.default_session
+        # the only session state that changes a deterministic reply is the
+        # riddle being answered (answers, skip)
+        riddle = state.current_riddle if state.riddle_active else None
+        key = (text, None if riddle is None else (riddle["q"], riddle["a"], tuple(riddle.get("alts", ()))))
+        # taken before replying, so a fact index build finishing meanwhile
+        # can't stamp an answer from the old index as current
+        facts_version = self._facts_version()
+        cached = self.reply_cache.get(key, facts_version) if self.reply_cache.maxsize else None
+        if cached is not None:
+            return cached[0], dict(cached[1]), cached[2], True
+        meta = {}
+        reply, intent = self._reply(text, state, meta)
+        if intent not in RANDOM_INTENTS:
+            # a fallback is a retrieval miss: a new fact can answer it next time
+            version = facts_version if intent in ("retrieval", "fallback") else None
+            self.reply_cache.put(key, (reply, dict(meta), intent), version)
+        return reply, meta, intent, False
+
+    def _facts_version(self):
+        # what retrieval answers from: the corpus and how much of it is indexed
+        return (id(self.facts), len(self.facts), len(self.fact_index))
+
+    def _reply(self, text, state, meta):
+        # returns (reply, intent)
+        if state.riddle_active and state.current_riddle:
+            expected = state.current_riddle["a"].strip().lower()
             user_ans = " ".join(text.split())
-            if expected == user_ans or expected in user_ans or user_ans in expected:
-                reply = "Congrats! That's correct 🎉"
-                meta['clear_riddle'] = True
-                return reply, meta
-            elif user_ans == "skip" or user_ans == "SKIP" or user_ans == "Skip":
+            if user_ans == "skip":
                 reply = "Riddle skipped...\n The correct answer is: " + expected
                 meta['clear_riddle'] = True
-                return reply, meta
+                return reply, "riddle_answer"
+            elif self.riddles.check(state.current_riddle, user_ans):
+                reply = "Congrats! That's correct 🎉"
+                meta['clear_riddle'] = True
+                return reply, "riddle_answer"
 
             else:
                 reply = "Not quite. Try again or type 'skip' to get the answer."
-                return reply, meta
+                return reply, "riddle_answer"
 
-        if text in CONVO_MAP:
-            reply = CONVO_MAP[text]
-            if text in ("bye", "goodbye"):
-                meta['clear_riddle'] = True
-            return reply, meta
+        match = self.matcher.match(text)
+        if match is None:
+            reply = self.fallback_reply(text, meta)
+            return reply, "retrieval" if meta.get('retrieved') else "fallback"
+        intent, payload = match
 
-        if any(g in text for g in ["how are", "how's it going", "how are you doing"]):
-            return CONVO_MAP.get("how are you"), meta
+        if intent == "convo":
+            if payload in ("bye", "goodbye"):
+                meta['clear_riddle'] = True
+            return CONVO_MAP.get(payload), "convo"
 
-        if text in ("riddle", "riddles", "ask riddle", "give me a riddle", "RIDDLES", "RIDDLE", "please give me a riddle"):
-            r = random.choice(RIDDLES)
-            self.current_riddle = r
-            self.riddle_active = True
+        if intent == "riddle":
+            r = self.pick("riddles", state)
+            state.current_riddle = r
+            state.riddle_active = True
             meta['riddle_question'] = True
-            return r["q"], meta
+            return r["q"], "riddle"
 
-        if text == "skip":
-            if self.riddle_active and self.current_riddle:
-                ans = self.current_riddle["a"]
+        if intent == "skip":
+            if state.riddle_active and state.current_riddle:
+                ans = state.current_riddle["a"]
                 meta['clear_riddle'] = True
-                return f"The answer is: {ans}", meta
+                return f"The answer is: {ans}", "skip"
             else:
-                return "No active riddle to skip. Try 'Riddles' to get one.", meta
+                return "No active riddle to skip. Try 'Riddles' to get one.", "skip"
 
-        if "joke" in text:
-            return random.choice(self.jokes), meta
+        if intent == "joke":
+            return self.get_random_joke(state), "joke"
 
-        if "fact" in text or "did you know" in text:
-            return random.choice(self.facts), meta
+        if intent == "fact":
+            return self.get_random_fact(state), "fact"
 
-        fallback = "I didn't get that. Try: 'hello', 'how are you', 'riddles', 'jokes', or 'facts'."
-        return fallback, meta
+        return FALLBACK_REPLY, "fallback"
 
-    def get_random_joke(self):
-        return random.choice(self.jokes) if self.jokes else DEFAULT_JOKES[0]
+    def fallback_reply(self, text, meta):
+        # best-matching fact for free text, else the fixed hint
+        self.fact_index.sync(self.facts)
+        hit = self.fact_index.search(text)
+        if hit is None:
+            return FALLBACK_REPLY
+        meta['retrieved'] = True
+        return hit[0]
 
-    def get_random_fact(self):
-        return random.choice(self.facts) if self.facts else DEFAULT_FACTS[0]
+    def get_random_joke(self, session=None):
+        return self.pick("jokes", session) or DEFAULT_JOKES[0]
 
-    def stop_riddle(self):
-        self.current_riddle = None
-        self.riddle_active = False
+    def get_random_fact(self, session=None):
+        return self.pick("facts", session) or DEFAULT_FACTS[0]
+
+    def set_weights(self, kind, weights):
+        # kind is "jokes", "facts" or "riddles"; one weight per item, None to clear
+        self.samplers[kind] = ContentSampler(weights)
+
+    def pick(self, kind, session=None):
+        corpus = getattr(self, kind)
+        state = (session or self.default_session).bag(kind)
+        i = self.samplers[kind].draw(len(corpus), state)
+        return None if i is None else corpus[i]
+
+    def stop_riddle(self, session=None):
+        (session or self.default_session).stop_riddle()
+
+# ---------------------------
+# Headless batch / stream mode
+# ---------------------------
+SESSION_KEYS = ("session", "session_id", "request_id")
+TEXT_KEYS = ("text", "message", "body")
+DEFAULT_FLUSH_EVERY = 512
+
+def read_messages(lines):
+    # Plain lines are messages for the default session; lines starting with
+    # "{" are JSONL records carrying their own session id.
+    for lineno, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if not line.startswith("{"):
+            yield None, line
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            print(f"[Batch input error] line {lineno}: {e}", file=sys.stderr)
+            continue
+        session = next((record[k] for k in SESSION_KEYS if k in record), None)
+        text = next((record[k] for k in TEXT_KEYS if k in record), None)
+        if not isinstance(text, str):
+            print(f"[Batch input error] line {lineno}: no text field", file=sys.stderr)
+            continue
+        yield session, text
+
+def generate_replies(core, messages):
+    for session_id, text in messages:
+        session = core.session(session_id)
+        reply, meta = core.get_reply(text, session)
+        if meta.get('clear_riddle'):
+            core.stop_riddle(session)
+        yield {"session": session_id, "text": text, "reply": reply, "meta": meta}
+
+def write_jsonl(records, out, flush_every=DEFAULT_FLUSH_EVERY):
+    count = 0
+    chunk = []
+    for record in records:
+        chunk.append(json.dumps(record, ensure_ascii=False))
+        if len(chunk) >= flush_every:
+            out.write("\n".join(chunk) + "\n")
+            out.flush()
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        out.write("\n".join(chunk) + "\n")
+        out.flush()
+        count += len(chunk)
+    return count
+
+def run_batch(input_path=None, output_path=None, flush_every=DEFAULT_FLUSH_EVERY):
+    core = ChatbotCore()
+    src = open(input_path, "r", encoding="utf-8") if input_path and input_path != "-" else sys.stdin
+    dst = open(output_path, "w", encoding="utf-8") if output_path and output_path != "-" else sys.stdout
+    try:
+        return write_jsonl(generate_replies(core, read_messages(src)), dst, flush_every)
+    finally:
+        core.close()
+        if src is not sys.stdin:
+            src.close()
+        if dst is not sys.stdout:
+            dst.close()
+
+# ---------------------------
+# Chat transcript
+# ---------------------------
+class TranscriptModel:
+    # Holds the last `max_onscreen` formatted messages; older ones are spilled
+    # to a temp file (offsets kept in an array) and can be paged back in.
+    def __init__(self, max_onscreen=TRANSCRIPT_MAX_ONSCREEN, page_size=TRANSCRIPT_PAGE):
+        self.max_onscreen = max_onscreen
+        self.page_size = page_size
+        self.onscreen = deque()
+        self.pending = []
+        self.first = 0            # history index of onscreen[0]
+        self._spill = None
+        self._spill_end = 0
+        self._offsets = array("Q")
+
+    def __len__(self):
+        return self.first + len(self.onscreen) + len(self.pending)
+
+    def add(self, entry):
+        self.pending.append(entry)
+
+    def flush_pending(self):
+        # Returns (entries to append to the widget, lines to delete from its top).
+        entries = self.pending
+        self.pending = []
+        shown = len(self.onscreen)
+        self.onscreen.extend(entries)
+        drop = max(0, len(self.onscreen) - self.max_onscreen)
+        lines = 0
+        for i in range(drop):
+            entry = self.onscreen.popleft()
+            if self.first == len(self._offsets):
+                self._spill_entry(entry)
+            self.first += 1
+            if i < shown:
+                lines += entry.count("\n")
+        return entries[max(0, drop - shown):], lines
+
+    def can_page_back(self):
+        return self.first > 0
+
+    def page_back(self, count=None):
+        count = count or self.page_size
+        start = max(0, self.first - count)
+        if start == self.first:
+            return []
+        end = self._offsets[self.first] if self.first < len(self._offsets) else self._spill_end
+        self._spill.seek(self._offsets[start])
+        blob = self._spill.read(end - self._offsets[start])
+        base = self._offsets[start]
+        entries = []
+        for i in range(start, self.first):
+            lo = self._offsets[i] - base
+            hi = (self._offsets[i + 1] if i + 1 < len(self._offsets) else end) - base
+            entries.append(blob[lo:hi].decode("utf-8"))
+        self.onscreen.extendleft(reversed(entries))
+        self.first = start
+        return entries
+
+    def clear(self):
+        self.onscreen.clear()
+        self.pending = []
+        self.first = 0
+        self._offsets = array("Q")
+        self._spill_end = 0
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _spill_entry(self, entry):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile("w+b", prefix="chat_transcript_")
+        data = entry.encode("utf-8")
+        self._spill.seek(self._spill_end)
+        self._spill.write(data)
+        self._offsets.append(self._spill_end)
+        self._spill_end += len(data)
+
+class TranscriptView:
+    # Binds a TranscriptModel to a Text widget: bursts of messages become one
+    # insert per frame, and scrolling to the top pages spilled history back.
+    def __init__(self, widget, model=None, flush_ms=TRANSCRIPT_FLUSH_MS):
+        self.widget = widget
+        self.model = model or TranscriptModel()
+        self.flush_ms = flush_ms
+        self._flush_job = None
+        self._page_job = None
+        vbar = getattr(widget, "vbar", None)
+        self._set_scrollbar = vbar.set if vbar is not None else None
+        widget.configure(yscrollcommand=self._on_scroll)
+
+    def add(self, sender, text):
+        stamp = time.strftime("%H:%M:%S")
+        self.model.add(f"{sender} [{stamp}]: {text}\n\n")
+        if self._flush_job is None:
+            self._flush_job = self.widget.after(self.flush_ms, self.flush)
+
+    def flush(self):
+        self._flush_job = None
+        entries, lines = self.model.flush_pending()
+        if not entries and not lines:
+            return
+        w = self.widget
+        w.configure(state="normal")
+        if lines:
+            w.delete("1.0", f"{lines + 1}.0")
+        if entries:
+            w.insert(tk.END, "".join(entries))
+        w.configure(state="disabled")
+        w.see(tk.END)
+
+    def clear(self):
+        if self._flush_job is not None:
+            self.widget.after_cancel(self._flush_job)
+            self._flush_job = None
+        self.model.clear()
+        self.widget.configure(state="normal")
+        self.widget.delete("1.0", tk.END)
+        self.widget.configure(state="disabled")
+
+    def _on_scroll(self, first, last):
+        if self._set_scrollbar:
+            self._set_scrollbar(first, last)
+        # only page when the text actually scrolls, otherwise a short page
+        # would keep the view at the top and pull in the whole history
+        if float(first) <= 0.0 and float(last) < 1.0 and self.model.can_page_back() and self._page_job is None:
+            self._page_job = self.widget.after_idle(self._page_back)
+
+    def _page_back(self):
+        self._page_job = None
+        entries = self.model.page_back()
+        if not entries:
+            return
+        text = "".join(entries)
+        lines = text.count("\n")
+        w = self.widget
+        w.configure(state="normal")
+        w.insert("1.0", text)
+        w.configure(state="disabled")
+        w.see(f"{lines + 1}.0")
+
+# ---------------------------
+# Themes
+# ---------------------------
+def load_themes(filepath=THEMES_FILE, default=THEMES, root=None):
+    # with a Tk `root`, colours are checked too: one bad value would
+    # otherwise stop the GUI from starting when the theme is applied
+    try:
+        if not os.path.exists(filepath):
+            return dict(default)
+        with open(filepath, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        themes = {}
+        for name, colors in data.items():
+            missing = [key for key in THEME_REQUIRED if not isinstance(colors, dict) or key not in colors]
+            if missing:
+                print(f"[Theme file] {filepath}: theme {name!r} is missing {', '.join(missing)}", file=sys.stderr)
+                continue
+            roles = [role for role in (*THEME_REQUIRED, *THEME_FALLBACKS) if role in colors]
+            invalid = [role for role in roles if not _valid_colour(root, colors[role])]
+            if invalid:
+                print(f"[Theme file] {filepath}: theme {name!r} has invalid colours for {', '.join(invalid)}",
+                      file=sys.stderr)
+                continue
+            themes[name] = colors
+        return themes or dict(default)
+    except Exception as e:
+        print(f"[File read error] {filepath}: {e}", file=sys.stderr)
+        return dict(default)
+
+def _valid_colour(root, value):
+    if not isinstance(value, str) or not value:
+        return False
+    if root is None:
+        return True
+    try:
+        root.winfo_rgb(value)
+        return True
+    except tk.TclError:
+        return False
+
+class ThemeEngine:
+    # Each theme is compiled once into (style, options) pairs. Widgets get
+    # their colours from a ttk style chosen when they are built, so a switch
+    # reconfigures the fixed set of THEME_STYLES and never walks the widget
+    # tree. Plain tk widgets (the root, Text) can't use ttk styles and are
+    # registered with the colour roles they need instead.
+    def __init__(self, root, themes, base=THEME_BASE):
+        self.style = ttk.Style(root)
+        if base in self.style.theme_names():
+            self.style.theme_use(base)
+        self.themes = {name: self._compile(colors) for name, colors in themes.items()}
+        self._registry = []   # (widget, {option: colour role})
+
+    def __contains__(self, name):
+        return name in self.themes
+
+    def names(self):
+        return list(self.themes)
+
+    def register(self, widget, **roles):
+        self._registry.append((widget, roles))
+
+    def apply(self, name):
+        colors, styles, maps = self.themes[name]
+        for style, options in styles:
+            self.style.configure(style, **options)
+        for style, options in maps:
+            self.style.map(style, **options)
+        for widget, roles in self._registry:
+            widget.configure(**{option: colors[role] for option, role in roles.items()})
+        return colors
+
+    @staticmethod
+    def _compile(colors):
+        colors = dict(colors)
+        for role, fallback in THEME_FALLBACKS.items():
+            colors.setdefault(role, colors[fallback])
+        styles = [(style, {opt: colors[role] for opt, role in options.items()})
+                  for style, options in THEME_STYLES.items()]
+        maps = [(style, {opt: [(state, colors[role]) for state, role in states] for opt, states in options.items()})
+                for style, options in THEME_MAPS.items()]
+        return colors, styles, maps
 
 # ---------------------------
 # GUI
@@ -227,20 +2482,33 @@ class ChatbotGUI(tk.Tk):
         # store whether we're fullscreen for potential toggling
         self.fullscreen = True
 
-        # default theme
-        self.current_theme_name = DEFAULT_THEME
-        self.theme = THEMES[self.current_theme_name]
+        self.font_title = ("Segoe UI", 18, "bold")
+        self.font_text = ("Segoe UI", 11)
+        self.font_small = ("Segoe UI", 9)
+
+        # themes come from themes.json and are compiled into ttk styles once
+        self.themes = ThemeEngine(self, load_themes(root=self))
+        self.themes.style.configure("Title.TLabel", font=self.font_title)
+        self.themes.style.configure("Ctrl.TLabelframe.Label", font=self.font_small)
+        self.current_theme_name = DEFAULT_THEME if DEFAULT_THEME in self.themes else self.themes.names()[0]
+        self.theme = self.themes.themes[self.current_theme_name][0]
 
         self.geometry("900x600")
         self.minsize(700, 500)
 
-        self.font_title = ("Segoe UI", 18, "bold")
-        self.font_text = ("Segoe UI", 11)
-        self.font_small = ("Segoe UI", 9)
+        # Core + TTS: content files and the speech engine load in the
+        # background once the first frame is up (see _start_background_init)
+        self.core = ChatbotCore(lazy=True, transcript_log=TranscriptLog(TRANSCRIPT_LOG_FILE))
+        self.tts = SafeTTS(enabled=VOICE_ENABLED_DEFAULT, autostart=False)
 
-        # Core + TTS
-        self.core = ChatbotCore()
-        self.tts = SafeTTS(enabled=VOICE_ENABLED_DEFAULT)
+        # Replies are computed off the Tk thread and handed back through a
+        # queue that the main loop drains; widgets are only touched here.
+        from concurrent.futures import ThreadPoolExecutor  # deferred: pulls in logging
+        self.reply_pool = ThreadPoolExecutor(max_workers=REPLY_WORKERS, thread_name_prefix="reply")
+        self.reply_queue = queue.Queue()
+        self._next_seq = 0
+        self._deliver_seq = 0
+        self._pending_replies = {}
 
         # Animation states
         self.cats_visible = False
@@ -250,50 +2518,89 @@ class ChatbotGUI(tk.Tk):
         self.theme_btns = {}
 
         # Build UI
-        self._build_ui()
-        self._bind_events()
-        self.apply_theme(self.current_theme_name)
+        with STARTUP.measure("build widgets"):
+            self._build_ui()
+            self._bind_events()
+            self.apply_theme(self.current_theme_name)
+        # closing from the title bar must flush additions and transcript too
+        self.protocol("WM_DELETE_WINDOW", self._on_exit)
 
         # initial welcome
         self._insert_bot_message("Hello! I'm pythonChatbot. Type 'Riddles' for a riddle, or use Categories -> Jokes/Facts.")
+        self.after(REPLY_POLL_MS, self._drain_replies)
+        self.after(STARTUP_DEFER_MS, self._start_background_init)
+
+    def _start_background_init(self):
+        STARTUP.record("first frame", time.perf_counter() - _IMPORT_STARTED)
+        self.core.load_content_async(watch=True)
+        self._enable_add_when_ready()
+        if self.tts.enabled:
+            self.tts.start()
+        if STARTUP.enabled:
+            self._report_startup_when_ready()
+
+    def _enable_add_when_ready(self):
+        # adding needs the content files open; poll rather than block the Tk
+        # thread on a big index build. If loading failed the buttons stay
+        # disabled and polling stops.
+        if self.core.content_ready.is_set():
+            self.add_joke_btn["state"] = "normal"
+            self.add_fact_btn["state"] = "normal"
+        elif self.core.content_failed.is_set():
+            self._insert_bot_message("I couldn't load my jokes/facts files, so adding to them is disabled. "
+                                     "I'll keep using the built-in ones.")
+        else:
+            self.after(100, self._enable_add_when_ready)
+
+    def _report_startup_when_ready(self):
+        tts_done = not self.tts.enabled or self.tts.ready.is_set()
+        content_done = self.core.content_ready.is_set() or self.core.content_failed.is_set()
+        if content_done and tts_done:
+            STARTUP.report()
+        else:
+            self.after(100, self._report_startup_when_ready)
 
     # -----------------------
     # UI Build
     # -----------------------
     def _build_ui(self):
         # Top bar
-        self.top_frame = tk.Frame(self, bg=self.theme["top_bg"], height=70)
+        self.themes.register(self, bg="bg")
+        self.top_frame = ttk.Frame(self, style="Top.TFrame", height=70)
         self.top_frame.pack(fill="x")
-        title = tk.Label(self.top_frame, text="pythonChatbot", font=self.font_title, fg="#e6eef8", bg=self.theme["top_bg"])
+        title = ttk.Label(self.top_frame, text="pythonChatbot", style="Title.TLabel")
         title.pack(side="left", padx=16, pady=12)
 
         # Right side top controls (Exit, Fullscreen toggle, Voice)
-        right_top = tk.Frame(self.top_frame, bg=self.theme["top_bg"])
+        right_top = ttk.Frame(self.top_frame, style="Top.TFrame")
         right_top.pack(side="right", padx=10)
         exit_btn = ttk.Button(right_top, text="Exit", command=self._on_exit)
         exit_btn.pack(side="right", padx=6)
         fs_btn = ttk.Button(right_top, text="Toggle Fullscreen", command=self._toggle_fullscreen)
         fs_btn.pack(side="right", padx=6)
         self.voice_var = tk.BooleanVar(value=self.tts.enabled)
-        voice_chk = ttk.Checkbutton(right_top, text="Voice", variable=self.voice_var, command=self._toggle_voice)
+        voice_chk = ttk.Checkbutton(right_top, text="Voice", variable=self.voice_var, command=self._toggle_voice,
+                                    style="Top.TCheckbutton")
         voice_chk.pack(side="right", padx=6)
 
         # Main frame
-        self.main_frame = tk.Frame(self, bg=self.theme["bg"])
+        self.main_frame = ttk.Frame(self, style="TFrame")
         self.main_frame.pack(fill="both", expand=True, padx=12, pady=(8,12))
 
         # Chat display
         self.chat_display = scrolledtext.ScrolledText(self.main_frame, wrap=tk.WORD, font=self.font_text, state="disabled",
-                                                      bg=self.theme["chat_bg"], fg=self.theme["chat_fg"], relief="flat", padx=10, pady=10)
+                                                      relief="flat", padx=10, pady=10)
+        self.themes.register(self.chat_display, bg="chat_bg", fg="chat_fg", insertbackground="chat_fg")
         self.chat_display.pack(fill="both", expand=True, side="left")
+        self.transcript = TranscriptView(self.chat_display)
 
         # Right control column
-        self.ctrl_frame = tk.Frame(self.main_frame, width=240, bg=self.theme["ctrl_bg"])
+        self.ctrl_frame = ttk.Frame(self.main_frame, width=240, style="Ctrl.TFrame")
         self.ctrl_frame.pack(fill="y", side="right", padx=(10,0))
         self.ctrl_frame.pack_propagate(False)
 
         # Button panel
-        btn_frame = tk.Frame(self.ctrl_frame, bg=self.theme["ctrl_bg"])
+        btn_frame = ttk.Frame(self.ctrl_frame, style="Ctrl.TFrame")
         btn_frame.pack(pady=8)
 
         self.btn_categories = ttk.Button(btn_frame, text="Categories", command=self._toggle_categories)
@@ -307,7 +2614,7 @@ class ChatbotGUI(tk.Tk):
         self.theme_btn.grid(row=2, column=0, pady=6, ipadx=6)
 
         # Other controls
-        ctrl2 = tk.Frame(self.ctrl_frame, bg=self.theme["ctrl_bg"])
+        ctrl2 = ttk.Frame(self.ctrl_frame, style="Ctrl.TFrame")
         ctrl2.pack(padx=6, pady=10, fill="x")
 
         exit_btn2 = ttk.Button(ctrl2, text="Exit", command=self._on_exit)
@@ -316,9 +2623,11 @@ class ChatbotGUI(tk.Tk):
         clear_btn.pack(fill="x", pady=4)
         manual_btn = ttk.Button(ctrl2, text="User Manual", command=self._show_manual)
         manual_btn.pack(fill="x", pady=4)
+        stats_btn = ttk.Button(ctrl2, text="Stats", command=self._show_stats)
+        stats_btn.pack(fill="x", pady=4)
 
         # Category container (for animated Jokes/Facts)
-        self.cat_container = tk.Frame(self.ctrl_frame, bg=self.theme["ctrl_bg"], height=110)
+        self.cat_container = ttk.Frame(self.ctrl_frame, style="Ctrl.TFrame", height=110)
         self.cat_container.pack(fill="x", pady=6)
 
         jokes_btn = ttk.Button(self.cat_container, text="Jokes", command=self._on_jokes_clicked)
@@ -327,28 +2636,27 @@ class ChatbotGUI(tk.Tk):
         self.cat_btns['facts'] = facts_btn
 
         # Theme options container (animated theme buttons)
-        self.theme_container = tk.Frame(self.ctrl_frame, bg=self.theme["ctrl_bg"], height=120)
+        names = self.themes.names()
+        self.theme_container = ttk.Frame(self.ctrl_frame, style="Ctrl.TFrame", height=max(120, 24 + 32 * len(names)))
         self.theme_container.pack(fill="x", pady=6)
-        # create theme buttons but keep hidden
-        light_btn = ttk.Button(self.theme_container, text="Light", command=lambda: self.apply_theme("Light"))
-        dark_btn = ttk.Button(self.theme_container, text="Dark", command=lambda: self.apply_theme("Dark"))
-        blue_btn = ttk.Button(self.theme_container, text="Blue", command=lambda: self.apply_theme("Blue"))
-        self.theme_btns['Light'] = light_btn
-        self.theme_btns['Dark'] = dark_btn
-        self.theme_btns['Blue'] = blue_btn
+        # create one button per theme but keep them hidden
+        for name in names:
+            self.theme_btns[name] = ttk.Button(self.theme_container, text=name,
+                                               command=lambda name=name: self.apply_theme(name))
 
         # Add content quick handlers
-        add_frame = tk.LabelFrame(self.ctrl_frame, text="Add Content", bg=self.theme["ctrl_bg"], fg="#cbd5e1", font=self.font_small)
+        add_frame = ttk.Labelframe(self.ctrl_frame, text="Add Content", style="Ctrl.TLabelframe")
         add_frame.pack(fill="x", padx=8, pady=8)
         self.add_entry = ttk.Entry(add_frame)
         self.add_entry.pack(fill="x", padx=6, pady=6)
-        add_joke_btn = ttk.Button(add_frame, text="Add as Joke", command=self._add_as_joke)
-        add_fact_btn = ttk.Button(add_frame, text="Add as Fact", command=self._add_as_fact)
-        add_joke_btn.pack(side="left", padx=6, pady=(0,8))
-        add_fact_btn.pack(side="right", padx=6, pady=(0,8))
+        # enabled once the content files are open (_enable_add_when_ready)
+        self.add_joke_btn = ttk.Button(add_frame, text="Add as Joke", command=self._add_as_joke, state="disabled")
+        self.add_fact_btn = ttk.Button(add_frame, text="Add as Fact", command=self._add_as_fact, state="disabled")
+        self.add_joke_btn.pack(side="left", padx=6, pady=(0,8))
+        self.add_fact_btn.pack(side="right", padx=6, pady=(0,8))
 
         # Bottom entry bar
-        bottom_frame = tk.Frame(self, bg=self.theme["entry_bg"])
+        bottom_frame = ttk.Frame(self, style="Entry.TFrame")
         bottom_frame.pack(fill="x", side="bottom")
         self.entry = ttk.Entry(bottom_frame, font=self.font_text)
         self.entry.pack(fill="x", padx=12, pady=8, side="left", expand=True)
@@ -359,38 +2667,11 @@ class ChatbotGUI(tk.Tk):
     # Theme application
     # -----------------------
     def apply_theme(self, theme_name):
-        if theme_name not in THEMES:
+        if theme_name not in self.themes:
             return
         self.current_theme_name = theme_name
-        self.theme = THEMES[theme_name]
-
-        # Update backgrounds and chat colors
-        try:
-            self.configure(bg=self.theme["bg"])
-            self.top_frame.configure(bg=self.theme["top_bg"])
-            # update title label color (find by children)
-            for child in self.top_frame.winfo_children():
-                if isinstance(child, tk.Label):
-                    child.configure(bg=self.theme["top_bg"])
-            self.main_frame.configure(bg=self.theme["bg"])
-            self.ctrl_frame.configure(bg=self.theme["ctrl_bg"])
-            self.cat_container.configure(bg=self.theme["ctrl_bg"])
-            self.theme_container.configure(bg=self.theme["ctrl_bg"])
-            self.chat_display.configure(bg=self.theme["chat_bg"], fg=self.theme["chat_fg"])
-            # bottom entry background
-            # Note: ttk.Entry doesn't accept bg reliably across platforms; use its master frame color
-            # update entry container background
-            # update the bottom frame background if present:
-            # (we'll set the bottom_frame's bg if possible)
-            for w in self.winfo_children():
-                if isinstance(w, tk.Frame) or isinstance(w, tk.LabelFrame):
-                    w.configure(bg=self.theme["bg"])
-        except Exception:
-            pass
-
-        # update text colors on control buttons/labels if needed
-        # For simplicity, force a small redraw by updating idletasks
-        self.update_idletasks()
+        # a handful of style updates, however many widgets are on screen
+        self.theme = self.themes.apply(theme_name)
 
         # give a small feedback
         self._insert_bot_message(f"Theme changed to {theme_name}.")
@@ -404,12 +2685,9 @@ class ChatbotGUI(tk.Tk):
     def _insert_user_message(self, text):
         self._insert_message("You", text)
 
+    @METRICS.timed("chatbot_insert_message_seconds")
     def _insert_message(self, sender, text):
-        stamp = time.strftime("%H:%M:%S")
-        self.chat_display.configure(state="normal")
-        self.chat_display.insert(tk.END, f"{sender} [{stamp}]: {text}\n\n")
-        self.chat_display.configure(state="disabled")
-        self.chat_display.see(tk.END)
+        self.transcript.add(sender, text)
 
     # -----------------------
     # Event binding and handlers
@@ -424,10 +2702,7 @@ class ChatbotGUI(tk.Tk):
 
     def _toggle_voice(self):
         enabled = self.voice_var.get()
-        if enabled and not self.tts.enabled:
-            self.tts = SafeTTS(enabled=True)
-        else:
-            self.tts.enabled = enabled
+        self.tts.set_enabled(enabled)
 
     def _toggle_fullscreen(self):
         self.fullscreen = not self.fullscreen
@@ -439,6 +2714,9 @@ class ChatbotGUI(tk.Tk):
 
     def _on_exit(self):
         # Attempt a graceful shutdown
+        self.reply_pool.shutdown(wait=False, cancel_futures=True)
+        self.tts.close()
+        self.core.close()
         try:
             self.destroy()
         except Exception:
@@ -450,17 +2728,43 @@ class ChatbotGUI(tk.Tk):
             return
         self._insert_user_message(user_text)
         self.entry.delete(0, tk.END)
-        threading.Thread(target=self._process_user_text, args=(user_text,), daemon=True).start()
+        self._submit_text(user_text)
 
-    def _process_user_text(self, user_text):
-        reply, meta = self.core.get_reply(user_text)
-        self._insert_bot_message(reply)
-        if self.tts.enabled:
-            self.tts.speak(reply)
-        if meta.get('riddle_question'):
-            self._insert_bot_message("(Type your answer directly in the input box. Type 'skip' to see the answer.)")
-        if meta.get('clear_riddle'):
-            self.core.stop_riddle()
+    def _submit_text(self, user_text):
+        seq = self._next_seq
+        self._next_seq += 1
+        try:
+            self.reply_pool.submit(self._process_user_text, seq, user_text)
+        except RuntimeError:
+            pass  # pool already shut down on exit
+
+    def _process_user_text(self, seq, user_text):
+        # runs on a pool thread: no Tk calls here
+        try:
+            reply, meta = self.core.get_reply(user_text)
+            if meta.get('clear_riddle'):
+                self.core.stop_riddle()
+        except Exception as e:
+            print(f"[Reply error] {e}", file=sys.stderr)
+            reply, meta = FALLBACK_REPLY, {}
+        self.reply_queue.put((seq, reply, meta))
+
+    def _drain_replies(self):
+        for _ in range(REPLY_BATCH):
+            try:
+                seq, reply, meta = self.reply_queue.get_nowait()
+            except queue.Empty:
+                break
+            self._pending_replies[seq] = (reply, meta)
+        while self._deliver_seq in self._pending_replies:
+            reply, meta = self._pending_replies.pop(self._deliver_seq)
+            self._deliver_seq += 1
+            self._insert_bot_message(reply)
+            if self.tts.enabled:
+                self.tts.speak(reply)
+            if meta.get('riddle_question'):
+                self._insert_bot_message(RIDDLE_HINT)
+        self.after(REPLY_POLL_MS, self._drain_replies)
 
     # -----------------------
     # Categories animation (Jokes/Facts)
@@ -563,7 +2867,7 @@ class ChatbotGUI(tk.Tk):
         w = cont.winfo_width() or cont.winfo_reqwidth() or 200
         start_x = -160
         target_x = 12  # left aligned
-        y_positions = {"Light": 8, "Dark": 40, "Blue": 72}
+        y_positions = {name: 8 + 32 * i for i, name in enumerate(self.theme_btns)}
         for name, btn in self.theme_btns.items():
             btn.place(x=start_x, y=y_positions[name], width=100)
         self.theme_visible = True
@@ -590,7 +2894,7 @@ class ChatbotGUI(tk.Tk):
         w = cont.winfo_width() or cont.winfo_reqwidth() or 200
         start_x = 12
         target_x = -160
-        y_positions = {"Light": 8, "Dark": 40, "Blue": 72}
+        y_positions = {name: 8 + 32 * i for i, name in enumerate(self.theme_btns)}
         self.animation_running = True
         def animate(step=0):
             if step > 20:
@@ -611,12 +2915,8 @@ class ChatbotGUI(tk.Tk):
     # Riddle actions
     # -----------------------
     def _on_riddles_clicked(self):
-        reply, meta = self.core.get_reply("riddles")
-        self._insert_bot_message(reply)
-        if self.tts.enabled:
-            self.tts.speak(reply)
-        if meta.get('riddle_question'):
-            self._insert_bot_message("(Type your answer directly in the input box. Type 'skip' to get the answer.)")
+        # goes through the reply pool so it is ordered with typed answers
+        self._submit_text("riddles")
 
     # -----------------------
     # Add content handlers
@@ -626,8 +2926,11 @@ class ChatbotGUI(tk.Tk):
         if not text:
             messagebox.showinfo("Add Joke", "Please enter text to add as a joke.")
             return
-        append_line_to_file(JOKES_FILE, text)
-        self.core.jokes.append(text)
+        if not self.core.content_ready.is_set():
+            return
+        if not self.core.jokes.append(text):
+            messagebox.showinfo("Add Joke", "That one is already in jokes.")
+            return
         self.add_entry.delete(0, tk.END)
         messagebox.showinfo("Add Joke", "Added to jokes")
 
@@ -636,8 +2939,11 @@ class ChatbotGUI(tk.Tk):
         if not text:
             messagebox.showinfo("Add Fact", "Please enter text to add as a fact.")
             return
-        append_line_to_file(FACTS_FILE, text)
-        self.core.facts.append(text)
+        if not self.core.content_ready.is_set():
+            return
+        if not self.core.facts.append(text):
+            messagebox.showinfo("Add Fact", "That one is already in facts.")
+            return
         self.add_entry.delete(0, tk.END)
         messagebox.showinfo("Add Fact", "Added to facts")
 
@@ -645,9 +2951,7 @@ class ChatbotGUI(tk.Tk):
     # Clear screen & manual
     # -----------------------
     def _clear_chat(self):
-        self.chat_display.configure(state="normal")
-        self.chat_display.delete("1.0", tk.END)
-        self.chat_display.configure(state="disabled")
+        self.transcript.clear()
         self._insert_bot_message("Screen cleared. Type anything to continue.")
 
     def _show_manual(self):
@@ -662,9 +2966,10 @@ class ChatbotGUI(tk.Tk):
             "- Use 'Add Content' to append new entries for jokes and facts\n\n"
             "- Program opens fullscreen on start. Press Escape or 'Toggle Fullscreen' to exit fullscreen.\n"
             "- 'Exit' button closes the program.\n"
-            "- 'Clear Screen' clears chat history.\n"
-            "- 'Theme' button animates theme options (Light/Dark/Blue). Choose one to apply.\n"
-            "- Voice: Toggle 'Voice' to enable/disable text-to-speech.\n\n"
+            "- 'Clear Screen' clears the chat window; every turn is still kept in transcript.log.\n"
+            "- 'Theme' button animates theme options (Light/Dark/Blue, or those in themes.json). Choose one to apply.\n"
+            "- Voice: Toggle 'Voice' to enable/disable text-to-speech.\n"
+            "- 'Stats' shows reply counts and latencies per intent (start with CHATBOT_METRICS=1).\n\n"
             "- Have fun!"
         )
         # show in a popup Toplevel
@@ -677,6 +2982,45 @@ class ChatbotGUI(tk.Tk):
         txt.insert(tk.END, manual_text)
         txt.configure(state="disabled")
 
+    def _show_stats(self):
+        top = tk.Toplevel(self)
+        top.title("Stats")
+        top.geometry("560x420")
+        top.configure(bg=self.theme["bg"])
+        if not METRICS.enabled:
+            ttk.Label(top, text=f"Metrics are off. Start the app with {METRICS_ENV}=1 to collect them.",
+                      wraplength=500).pack(padx=12, pady=12)
+            return
+        columns = ("hits", "p50", "p90", "p99")
+        tree = ttk.Treeview(top, columns=columns, height=10)
+        tree.heading("#0", text="Intent")
+        tree.column("#0", width=160)
+        for col in columns:
+            tree.heading(col, text=col if col == "hits" else f"{col} (ms)")
+            tree.column(col, width=90, anchor="e")
+        tree.pack(fill="both", expand=True, padx=8, pady=8)
+        other = ttk.Label(top, justify="left", font=self.font_small)
+        other.pack(fill="x", padx=8, pady=(0, 8))
+
+        def refresh():
+            if not top.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for intent, count, p50, p90, p99 in METRICS.summary("chatbot_reply_seconds", "intent"):
+                tree.insert("", tk.END, text=intent,
+                            values=(count, f"{p50 * 1000:.3f}", f"{p90 * 1000:.3f}", f"{p99 * 1000:.3f}"))
+            cache = self.core.reply_cache.stats()
+            lines = [f"reply cache: {cache['size']}/{cache['maxsize']} entries, {cache['hit_rate']:.0%} hit rate"]
+            for name in ("chatbot_insert_message_seconds", "chatbot_tts_speak_seconds",
+                         "chatbot_file_read_seconds", "chatbot_file_append_seconds"):
+                for _, count, p50, _, p99 in METRICS.summary(name, "intent"):
+                    label = name[len("chatbot_"):-len("_seconds")].replace("_", " ")
+                    lines.append(f"{label}: {count} calls, p50 {p50 * 1000:.3f} ms, p99 {p99 * 1000:.3f} ms")
+            other.configure(text="\n".join(lines))
+            top.after(STATS_REFRESH_MS, refresh)
+
+        refresh()
+
     # -----------------------
     # Clear & Exit already defined
     # -----------------------
@@ -684,7 +3028,56 @@ class ChatbotGUI(tk.Tk):
 # ---------------------------
 # Run the app
 # ---------------------------
-def main():
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="pythonChatbot")
+    parser.add_argument("--batch", action="store_true",
+                        help="run headless: read messages (plain lines or JSONL) and write JSONL replies")
+    parser.add_argument("-i", "--input", default="-", help="batch input file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="batch output file (default: stdout)")
+    parser.add_argument("--flush-every", type=int, default=DEFAULT_FLUSH_EVERY,
+                        help="number of replies buffered before each write")
+    parser.add_argument("--metrics", action="store_true",
+                        help=f"collect metrics and export them every {METRICS_INTERVAL_ENV} seconds "
+                             f"to {METRICS_FILE_ENV} or stdout (or set {METRICS_ENV}=1)")
+    parser.add_argument("--tail-log", type=int, metavar="N",
+                        help=f"print the last N logged turns of {TRANSCRIPT_LOG_FILE} as JSONL and exit")
+    parser.add_argument("--compact-log", type=float, metavar="DAYS",
+                        help=f"drop turns older than DAYS from {TRANSCRIPT_LOG_FILE} and exit")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help=f"report import and init time per component (or set {PROFILE_STARTUP_ENV}=1)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile_startup and not STARTUP.enabled:
+        STARTUP.enabled = True
+        STARTUP.record("import tkinter", _TK_IMPORTED - _IMPORT_STARTED)
+        STARTUP.record("import other modules", _IMPORTS_DONE - _TK_IMPORTED)
+    if args.metrics:
+        METRICS.enabled = True
+    if args.tail_log is not None or args.compact_log is not None:
+        log = TranscriptLog(TRANSCRIPT_LOG_FILE)
+        if args.compact_log is not None:
+            dropped = log.compact(before_ts=time.time() - args.compact_log * 86400)
+            print(f"[Transcript log] {TRANSCRIPT_LOG_FILE}: dropped {dropped} turns, {len(log)} kept", file=sys.stderr)
+        if args.tail_log is not None:
+            fields = ("time", "session", "sender", "text", "intent")
+            write_jsonl((dict(zip(fields, turn)) for turn in log.tail(args.tail_log)), sys.stdout)
+        return
+    if args.batch:
+        # keep exported metrics out of the JSONL reply stream
+        metrics_out = sys.stderr if args.output == "-" else None
+        METRICS.start_exporter(metrics_out)
+        try:
+            run_batch(args.input, args.output, max(1, args.flush_every))
+        except KeyboardInterrupt:
+            pass
+        METRICS.stop_exporter(metrics_out)
+        if STARTUP.enabled:
+            STARTUP.report()
+        return
+    METRICS.start_exporter()
     app = ChatbotGUI()
     # Centering isn't necessary since fullscreen, but ensure window update for some platforms:
     app.update_idletasks()
@@ -692,6 +3085,8 @@ def main():
         app.mainloop()
     except KeyboardInterrupt:
         pass
+    app.core.close()
+    METRICS.stop_exporter()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,192 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_scanner import DEFAULT_SCAN_WORKERS, IMAGE_EXTENSIONS, extension_set, file_extension, list_dir
+
+# -----------------------------
+# Settings
+# -----------------------------
+CATALOG_FILE = "image_catalog.sqlite"
+# A directory modified this close to the time it was listed may change again
+# within the same mtime tick, so its listing is not trusted on the next run.
+RACY_WINDOW_NS = 2 * 10**9
+FETCH_SIZE = 1000
+LIST_BATCH = 64           # directories listed in parallel before their rows are written
+# bumped when older catalogs can't be trusted; their directory rows are dropped
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    scanned_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    PRIMARY KEY (dir, name)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hashes (
+    inode INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    PRIMARY KEY (inode, mtime_ns, size, kind)
+) WITHOUT ROWID;
+"""
+
+# -----------------------------
+# Catalog
+# -----------------------------
+# Remembers every file (path, size, mtime, inode) under the folders the image
+# manager works on. refresh() stats each known directory and only lists the
+# ones whose mtime changed, since adding, removing or renaming an entry
+# always bumps its directory's mtime. Subdirectories of an unchanged
+# directory come from the catalog, so an untouched tree costs one stat per
+# directory instead of one per file. Directories that do need listing are
+# listed a level at a time on `workers` threads. A file rewritten in place
+# does not touch its directory, so its size/mtime here can be stale:
+# re-stat before trusting them. A connection belongs to the thread that
+# opened it; give each worker thread its own ImageCatalog.
+class ImageCatalog:
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            # version 0 stored no rows for the subfolders of a folder refreshed
+            # non-recursively, so those subtrees would never be listed
+            with self.db:
+                self.db.execute("DELETE FROM dirs")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self, root, recursive=True, workers=DEFAULT_SCAN_WORKERS):
+        # returns (directories listed, directories reused from the catalog)
+        root = os.path.abspath(root)
+        listed = reused = 0
+        now = time.time_ns()
+        with self.db, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            level = [(root, os.path.dirname(root))]
+            while level:
+                below = []
+                stale = []
+                for folder, parent in level:
+                    try:
+                        st = os.stat(folder)
+                    except OSError:
+                        self._forget(folder)
+                        continue
+                    row = self.db.execute("SELECT mtime_ns, scanned_ns FROM dirs WHERE path = ?", (folder,)).fetchone()
+                    if row and row[0] == st.st_mtime_ns and row[0] < row[1] - RACY_WINDOW_NS:
+                        reused += 1
+                        if recursive:
+                            children = self.db.execute("SELECT path FROM dirs WHERE parent = ?", (folder,))
+                            below.extend((child, folder) for (child,) in children.fetchall())
+                    else:
+                        stale.append((folder, parent, st.st_mtime_ns))
+                for i in range(0, len(stale), LIST_BATCH):
+                    batch = stale[i:i + LIST_BATCH]
+                    for (folder, parent, mtime_ns), listing in zip(batch, pool.map(_list, [b[0] for b in batch])):
+                        listed += 1
+                        subdirs = self._store(folder, parent, mtime_ns, now, listing)
+                        if recursive:
+                            below.extend((sub, folder) for sub in subdirs)
+                level = below
+        return listed, reused
+
+    def count(self, root, extensions=IMAGE_EXTENSIONS, recursive=True):
+        where, args = self._where(root, extensions, recursive)
+        return self.db.execute(f"SELECT COUNT(*) FROM files WHERE {where}", args).fetchone()[0]
+
+    def iter_files(self, root, extensions=IMAGE_EXTENSIONS, recursive=True):
+        # yields (path, size, mtime_ns, inode) as stored by the last refresh()
+        where, args = self._where(root, extensions, recursive)
+        cursor = self.db.execute(f"SELECT dir, name, size, mtime_ns, inode FROM files WHERE {where}", args)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for folder, name, size, mtime_ns, inode in rows:
+                yield os.path.join(folder, name), size, mtime_ns, inode
+
+    # -----------------------------
+    # Content hashes
+    # -----------------------------
+    # Keyed by (inode, mtime_ns, size): rewriting a file changes its mtime,
+    # so a cached digest is never served for different content.
+    def get_hash(self, key, kind):
+        row = self.db.execute("SELECT digest FROM hashes WHERE inode = ? AND mtime_ns = ? AND size = ? AND kind = ?",
+                              (*key, kind)).fetchone()
+        return row[0] if row else None
+
+    def put_hashes(self, rows, kind):
+        # rows: iterable of (key, digest)
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                                ((*key, kind, digest) for key, digest in rows))
+
+    def _where(self, root, extensions, recursive):
+        root = os.path.abspath(root)
+        exts = sorted(extension_set(extensions))
+        ext_sql = f"ext IN ({','.join('?' * len(exts))})"
+        if not recursive:
+            return f"dir = ? AND {ext_sql}", [root, *exts]
+        prefix = os.path.join(root, "")
+        # range instead of LIKE so the primary key index is used and
+        # '%' / '_' in folder names need no escaping
+        return f"(dir = ? OR (dir >= ? AND dir < ?)) AND {ext_sql}", [root, prefix, prefix + "\U0010ffff", *exts]
+
+    def _store(self, folder, parent, mtime_ns, now, listing):
+        if listing is None:
+            self._forget(folder)
+            return []
+        subdirs, files = listing
+        self.db.execute("DELETE FROM files WHERE dir = ?", (folder,))
+        self.db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)", ((folder, *f) for f in files))
+        current = set(subdirs)
+        for (old,) in self.db.execute("SELECT path FROM dirs WHERE parent = ?", (folder,)).fetchall():
+            if old not in current:
+                self._forget(old)
+        # every subfolder gets a row, even on a non-recursive refresh: a later
+        # recursive one finds its children here. mtime -1 never matches, so
+        # a subfolder not listed yet is listed when it is first reached.
+        self.db.executemany("INSERT OR IGNORE INTO dirs VALUES (?, ?, -1, 0)", ((sub, folder) for sub in subdirs))
+        self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", (folder, parent, mtime_ns, now))
+        return subdirs
+
+    def _forget(self, folder):
+        # drop a directory and everything catalogued below it
+        prefix = os.path.join(folder, "")
+        end = prefix + "\U0010ffff"
+        self.db.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (folder, prefix, end))
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (folder, prefix, end))
+
+def _list(folder):
+    # runs on the pool: (subdirs, [(name, ext, size, mtime_ns, inode)]), or
+    # None when the directory can't be listed
+    try:
+        subdirs, entries = list_dir(folder)
+    except OSError:
+        return None
+    files = []
+    for entry in entries:
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        files.append((entry.name, file_extension(entry.name), st.st_size, st.st_mtime_ns, st.st_ino))
+    return subdirs, files
@@ -0,0 +1,169 @@
+import hashlib
+import itertools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from image_transfer import fast_copy
+
+# -----------------------------
+# Settings
+# -----------------------------
+PARTIAL_BYTES = 64 * 1024   # hashed from each end of a file before reading all of it
+HASH_CHUNK = 1024 * 1024
+# hashing mostly waits on reads, and hashlib releases the GIL on big buffers
+DEFAULT_HASH_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+# off: copy everything; skip: don't copy duplicates; link: hard-link them to
+# the copy already there; report: copy everything but list duplicates
+DEDUPE_MODES = ("off", "skip", "link", "report")
+
+# work done by the last find_duplicates() call
+hash_stats = {}
+
+# -----------------------------
+# Hashing
+# -----------------------------
+def partial_hash(path, size):
+    # first and last PARTIAL_BYTES; files that small are hashed whole, so
+    # for them this already is the content hash
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        if size <= 2 * PARTIAL_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(PARTIAL_BYTES))
+            f.seek(-PARTIAL_BYTES, os.SEEK_END)
+            h.update(f.read(PARTIAL_BYTES))
+    return h.digest()
+
+def full_hash(path, size):
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                return h.digest()
+            h.update(chunk)
+
+def _hash_files(files, kind, func, cache, workers):
+    # files: list of (path, key), key = (inode, mtime_ns, size)
+    # returns {path: digest}; unreadable files are left out
+    digests = {}
+    todo = {}
+    for path, key in files:
+        digest = cache.get_hash(key, kind) if cache is not None else None
+        if digest is not None:
+            digests[path] = digest
+            hash_stats["cached"] += 1
+        else:
+            todo.setdefault(key, []).append(path)  # hard links are hashed once
+
+    def work(key):
+        try:
+            return func(todo[key][0], key[2])
+        except OSError:
+            return None
+
+    computed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for key, digest in zip(todo, pool.map(work, todo)):
+            if digest is None:
+                continue
+            computed.append((key, digest))
+            for path in todo[key]:
+                digests[path] = digest
+    hash_stats[kind] += len(todo)
+    hash_stats["bytes"] += sum(min(key[2], 2 * PARTIAL_BYTES) if kind == "partial" else key[2] for key in todo)
+    if cache is not None and computed:
+        cache.put_hashes(computed, kind)
+    return digests
+
+def _regroup(groups, digests, sources):
+    # split each group by digest, keeping only groups that still hold a
+    # source and something it duplicates
+    result = []
+    for group in groups:
+        by_digest = {}
+        for path, key in group:
+            if path in digests:
+                by_digest.setdefault(digests[path], []).append((path, key))
+        result.extend(g for g in by_digest.values() if len(g) > 1 and any(path in sources for path, _ in g))
+    return result
+
+# -----------------------------
+# Duplicate search
+# -----------------------------
+# existing / sources: (path, size, mtime_ns, inode) tuples, as
+# ImageCatalog.iter_files() yields them. Returns {source path: original}
+# for every source whose content is already in `existing` or earlier in
+# `sources`; an existing copy is preferred as the original. Files are
+# grouped by size, then by a hash of their ends, and only read in full when
+# those match. Digests are cached in `cache` (an ImageCatalog) by inode,
+# mtime and size, so files seen on an earlier run are not read again.
+# progress(stage, files), if given, is called before each stage:
+# ("sizes", files compared), ("partial", files to hash), ("full", ...).
+def find_duplicates(existing, sources, cache=None, workers=DEFAULT_HASH_WORKERS, progress=None):
+    hash_stats.clear()
+    hash_stats.update(files=0, partial=0, full=0, cached=0, bytes=0)
+    sources = list(sources)
+    source_paths = {path for path, *_ in sources}
+    by_size = {}
+    for path, size, _, _ in itertools.chain(existing, sources):
+        by_size.setdefault(size, []).append(path)
+        hash_stats["files"] += 1
+    if progress is not None:
+        progress("sizes", hash_stats["files"])
+
+    groups = []
+    for size, paths in by_size.items():
+        if len(paths) < 2 or not any(path in source_paths for path in paths):
+            continue
+        group = []
+        seen = set()
+        for path in paths:
+            if path in seen:
+                continue  # a source folder inside the destination
+            seen.add(path)
+            # the catalog's stat can be stale for files rewritten in place
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if st.st_size == size:
+                group.append((path, (st.st_ino, st.st_mtime_ns, st.st_size)))
+        if len(group) > 1:
+            groups.append(group)
+
+    candidates = [item for group in groups for item in group]
+    if progress is not None:
+        progress("partial", len(candidates))
+    groups = _regroup(groups, _hash_files(candidates, "partial", partial_hash, cache, workers), source_paths)
+    large = [item for group in groups for item in group if item[1][2] > 2 * PARTIAL_BYTES]
+    if large:
+        if progress is not None:
+            progress("full", len(large))
+        full = _hash_files(large, "full", full_hash, cache, workers)
+        small = [g for g in groups if g[0][1][2] <= 2 * PARTIAL_BYTES]
+        groups = small + _regroup([g for g in groups if g[0][1][2] > 2 * PARTIAL_BYTES], full, source_paths)
+
+    duplicates = {}
+    for group in groups:
+        original = group[0][0]
+        for path, _ in group[1:]:
+            if path in source_paths:
+                duplicates[path] = original
+    return duplicates
+
+# -----------------------------
+# Hard links
+# -----------------------------
+def link_or_copy(original, src, dest):
+    # hard-link dest to the identical original; copy src instead where the
+    # filesystem can't (FAT/exFAT, another device, link limit) or the
+    # original is not there (yet)
+    try:
+        os.link(original, dest)
+    except FileExistsError:
+        raise
+    except OSError:
+        fast_copy(src, dest)
+    return dest
@@ -0,0 +1,42 @@
+import os
+
+# -----------------------------
+# Settings
+# -----------------------------
+IMAGE_EXTENSIONS = frozenset((".jpg", ".jpeg", ".png", ".webp", ".heic"))
+# directory listing waits on the disk, not the CPU, so threads overlap well
+DEFAULT_SCAN_WORKERS = min(8, (os.cpu_count() or 1) * 2)
+
+# -----------------------------
+# Extension matching
+# -----------------------------
+def extension_set(extensions):
+    # normalise "JPG", ".jpg", " .Jpg " ... to ".jpg"
+    return frozenset("." + ext.strip().lower().lstrip(".") for ext in extensions if ext.strip())
+
+def file_extension(name):
+    return os.path.splitext(name.strip())[1].lower()
+
+def is_image(name, extensions=IMAGE_EXTENSIONS):
+    return file_extension(name) in extensions
+
+# -----------------------------
+# Listing
+# -----------------------------
+def list_dir(folder, extensions=None):
+    # (subdirectory paths, os.DirEntry files) of one directory; extensions=None
+    # keeps every file. entry.stat() reuses what the listing returned where
+    # the OS provides it. Directory symlinks are not followed. Raises OSError
+    # when the directory can't be listed.
+    subdirs = []
+    files = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif extensions is None or is_image(entry.name, extensions):
+                    files.append(entry)
+            except OSError:
+                continue
+    return subdirs, files
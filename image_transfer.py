@@ -0,0 +1,284 @@
+import errno
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# -----------------------------
+# Settings
+# -----------------------------
+# Copies and moves wait on the disk far more than on the CPU, so a few more
+# threads than cores keeps the device busy.
+DEFAULT_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+PROGRESS_INTERVAL = 0.1   # seconds between progress events
+COPY_CHUNK = 1024 * 1024  # bytes per read/write when the kernel can't copy for us
+FICLONE = 0x40049409      # _IOW(0x94, 9, int) in linux/fs.h: share extents (reflink)
+
+# -----------------------------
+# Fast copy / move
+# -----------------------------
+# fast_copy / fast_move are drop-in replacements for shutil.copy2 /
+# shutil.move on single files. On Linux the data is cloned (FICLONE) where
+# the filesystem supports it (btrfs, XFS, ...), otherwise copied inside the
+# kernel with copy_file_range or sendfile, and only as a last resort through
+# a user-space buffer. Metadata is copied from the one fstat already taken,
+# through the open descriptors. Other platforms use shutil.copy2.
+_LINUX = sys.platform.startswith("linux")
+_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY,
+                errno.EBADF, errno.EPERM, errno.ETXTBSY)
+_no_reflink = set()       # (source device, dest device) pairs where FICLONE failed
+_no_copy_range = set()    # ... where copy_file_range failed
+_no_sendfile = set()
+copy_methods = {}         # method -> files copied with it
+_methods_lock = threading.Lock()
+
+def _count(method):
+    with _methods_lock:
+        copy_methods[method] = copy_methods.get(method, 0) + 1
+
+def _copy_data(src_fd, dst_fd, size, devs):
+    if fcntl is not None and devs not in _no_reflink:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return "reflink"
+        except OSError:
+            _no_reflink.add(devs)
+    # copy_file_range / sendfile can return 0 without copying anything (some
+    # kernels and filesystems); then the next method is tried. A short copy
+    # after some data went through is an error, never a success.
+    offset = 0
+    if hasattr(os, "copy_file_range") and devs not in _no_copy_range:
+        try:
+            while offset < size:
+                n = os.copy_file_range(src_fd, dst_fd, size - offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if offset or e.errno not in _UNSUPPORTED:
+                raise
+        if offset == size:
+            return "copy_file_range"
+        _check_progress(offset, size)
+        _no_copy_range.add(devs)
+    if hasattr(os, "sendfile") and devs not in _no_sendfile:
+        try:
+            while offset < size:
+                n = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if offset or e.errno not in _UNSUPPORTED:
+                raise
+        if offset == size:
+            return "sendfile"
+        _check_progress(offset, size)
+        _no_sendfile.add(devs)
+    copied = 0
+    while True:
+        chunk = os.read(src_fd, COPY_CHUNK)
+        if not chunk:
+            break
+        view = memoryview(chunk)
+        while view:
+            view = view[os.write(dst_fd, view):]
+        copied += len(chunk)
+    if copied != size:
+        raise OSError(errno.EIO, f"copied {copied} of {size} bytes")
+    return "read/write"
+
+def _check_progress(offset, size):
+    if offset:
+        raise OSError(errno.EIO, f"copied {offset} of {size} bytes")
+
+def _copy_metadata(src_fd, dst_fd, st):
+    # what shutil.copystat does, but on the open files and from one fstat
+    if hasattr(os, "listxattr"):
+        try:
+            for name in os.listxattr(src_fd):
+                try:
+                    os.setxattr(dst_fd, name, os.getxattr(src_fd, name))
+                except OSError as e:
+                    if e.errno not in (errno.EPERM, errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+                        raise
+        except OSError as e:
+            if e.errno not in (errno.ENOTSUP, errno.ENODATA, errno.EINVAL):
+                raise
+    os.chmod(dst_fd, st.st_mode & 0o7777)
+    os.utime(dst_fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+def fast_copy(src, dest):
+    if not _LINUX:
+        _count("copy2")
+        return shutil.copy2(src, dest)
+    with open(src, "rb") as fsrc:
+        st = os.fstat(fsrc.fileno())
+        try:
+            dst_st = os.stat(dest)
+            if os.path.samestat(st, dst_st):
+                raise shutil.SameFileError(f"{src!r} and {dest!r} are the same file")
+        except FileNotFoundError:
+            pass
+        try:
+            with open(dest, "wb") as fdst:
+                devs = (st.st_dev, os.fstat(fdst.fileno()).st_dev)
+                _count(_copy_data(fsrc.fileno(), fdst.fileno(), st.st_size, devs))
+                _copy_metadata(fsrc.fileno(), fdst.fileno(), st)
+        except BaseException:
+            # never leave a truncated copy behind (fast_move keeps the source)
+            try:
+                os.unlink(dest)
+            except OSError:
+                pass
+            raise
+    return dest
+
+def fast_move(src, dest):
+    # same filesystem: a rename, no data is read or written
+    try:
+        os.replace(src, dest)
+        _count("rename")
+        return dest
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            try:
+                same_device = os.stat(src).st_dev == os.stat(os.path.dirname(os.path.abspath(dest))).st_dev
+            except OSError:
+                same_device = True
+            if same_device:
+                raise
+    fast_copy(src, dest)
+    os.unlink(src)
+    return dest
+
+# -----------------------------
+# Destination names
+# -----------------------------
+def assign_names(names, taken):
+    # name -> destination name that replaces nothing in `taken` (what is
+    # already in the destination folder) or another of `names`:
+    # "photo.jpg" -> "photo (1).jpg". Compared with normcase, so clashes
+    # that only differ in case are caught on Windows.
+    taken = {os.path.normcase(name) for name in taken}
+    result = {}
+    clashes = []
+    for name in names:
+        if os.path.normcase(name) in taken:
+            clashes.append(name)
+        else:
+            result[name] = name
+            taken.add(os.path.normcase(name))
+    for name in clashes:
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while os.path.normcase(f"{stem} ({n}){ext}") in taken:
+            n += 1
+        result[name] = f"{stem} ({n}){ext}"
+        taken.add(os.path.normcase(result[name]))
+    return result
+
+# -----------------------------
+# Transfer engine
+# -----------------------------
+# Runs action_func(src_file, dest_file) for every job on a pool of worker
+# threads. Nothing here touches Tk: the GUI drains `events` with after().
+# Events are tuples:
+#   ("progress", done, failed, total, last_name)
+#   ("error", name, message)
+#   ("done", done_names, failed, total, cancelled)
+class TransferEngine:
+    def __init__(self, action_func, jobs, workers=DEFAULT_WORKERS):
+        # jobs: list of (src_file, dest_file, name)
+        self.action_func = action_func
+        self.jobs = list(jobs)
+        self.workers = max(1, min(workers, len(self.jobs) or 1))
+        self.events = queue.Queue()
+        self.done_names = []
+        self.failed = 0
+        self._next = 0
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._last_report = 0.0
+        self._threads = []
+        self._active = 0
+
+    @property
+    def total(self):
+        return len(self.jobs)
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def start(self):
+        self._active = self.workers
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"transfer-{i}", daemon=True)
+            self._threads.append(t)
+            t.start()
+        return self
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        # files already being transferred finish; nothing new is started
+        self._cancelled.set()
+        self._running.set()
+
+    def wait(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _work(self):
+        while True:
+            self._running.wait()
+            if self._cancelled.is_set():
+                break
+            with self._lock:
+                i = self._next
+                if i >= len(self.jobs):
+                    break
+                self._next += 1
+            src_file, dest_file, name = self.jobs[i]
+            try:
+                self.action_func(src_file, dest_file)
+                ok = True
+            except Exception as e:
+                ok = False
+                self.events.put(("error", name, str(e)))
+            with self._lock:
+                if ok:
+                    self.done_names.append(name)
+                else:
+                    self.failed += 1
+                now = time.monotonic()
+                report = now - self._last_report >= PROGRESS_INTERVAL
+                if report:
+                    self._last_report = now
+                    progress = ("progress", len(self.done_names), self.failed, len(self.jobs), name)
+            if report:
+                self.events.put(progress)
+        with self._lock:
+            self._active -= 1
+            last = self._active == 0
+        if last:
+            self.events.put(("progress", len(self.done_names), self.failed, len(self.jobs), ""))
+            self.events.put(("done", list(self.done_names), self.failed, len(self.jobs), self.cancelled))
@@ -1,10 +1,14 @@
 import os
-import shutil
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from datetime import datetime
-import time
+import queue
+import threading
 import matplotlib.pyplot as plt
+from image_transfer import TransferEngine, DEFAULT_WORKERS, assign_names, fast_copy, fast_move
+from image_scanner import IMAGE_EXTENSIONS
+from image_catalog import ImageCatalog
+from image_dedupe import DEDUPE_MODES, find_duplicates, link_or_copy
 
 # -----------------------------
 # Global variables
@@ -15,23 +19,35 @@ last_moved_types = {}
 window = None
 message_label = None
 progress_bar = None
+transfer = None          # the running TransferEngine, if any
+job = None               # events queue of the running catalog job, if any
+POLL_MS = 50             # how often the GUI drains transfer and job progress
+# file types handled by Move/Copy/Delete (case-insensitive)
+EXTENSIONS = IMAGE_EXTENSIONS
+EXT_LABEL = "/".join(sorted(ext[1:].upper() for ext in EXTENSIONS))
+# how each Copy duplicates mode reports what it did
+DEDUPE_DONE = {"skip": "skipped", "link": "linked", "report": "found"}
+DEDUPE_STAGES = {"sizes": "comparing sizes of {} files", "partial": "hashing the ends of {} files",
+                 "full": "hashing {} files in full"}
 
 # -----------------------------
 # Move image files
 # -----------------------------
 def move_image_files():
-    process_images(shutil.move, "Moved")
+    process_images(fast_move, "Moved")
 
 # -----------------------------
 # Copy image files
 # -----------------------------
 def copy_image_files():
-    process_images(shutil.copy2, "Copied")
+    process_images(fast_copy, "Copied", dedupe_var.get())
 
 # -----------------------------
 # Shared process function
 # -----------------------------
-def process_images(action_func, action_name):
+def process_images(action_func, action_name, dedupe_mode="off"):
+    if transfer is not None or job is not None:
+        return  # one operation at a time
     src = src_path.get().strip()
     dest = dest_path.get().strip()
 
@@ -45,40 +61,177 @@ def process_images(action_func, action_name):
 
     if not os.path.exists(dest):
         os.makedirs(dest)
+    # the catalog works with absolute paths
+    src, dest = os.path.abspath(src), os.path.abspath(dest)
+
+    message_label.config(text=f"🔍 Scanning {src}...", fg="blue")
+    start_catalog_job(plan_transfer, lambda plan: start_transfer(plan, action_func, action_name),
+                      src, dest, dedupe_mode)
+
+def plan_transfer(catalog, events, src, dest, dedupe_mode):
+    # runs on the job thread: which files go where
+    # only lists the folder again if it changed since the last run
+    catalog.refresh(src, recursive=False)
+    sources = list(catalog.iter_files(src, EXTENSIONS, recursive=False))
+    plan = {"src": src, "dest": dest, "dedupe_mode": dedupe_mode, "found": len(sources),
+            "img_files": [], "names": {}, "links": {}, "duplicates": {}}
+    if not sources:
+        return plan
+
+    # source file -> identical file already in the destination (or earlier in this batch)
+    duplicates = {}
+    if dedupe_mode != "off":
+        events.put(("status", f"🔍 Checking for duplicates: scanning {dest}..."))
+        catalog.refresh(dest)
+        duplicates = find_duplicates(
+            catalog.iter_files(dest, EXTENSIONS), sources, catalog,
+            progress=lambda stage, files: events.put(
+                ("status", f"🔍 Checking for duplicates: {DEDUPE_STAGES[stage].format(files)}...")))
+        events.put(("status", f"🔍 {len(duplicates)} of {len(sources)} files are duplicates"))
+
+    skip = set()
+    if dedupe_mode == "skip":
+        skip = set(duplicates)
+    elif dedupe_mode == "link":
+        # already in the destination under the same name: nothing to link
+        skip = {f for f, original in duplicates.items()
+                if original == os.path.join(dest, os.path.basename(f))}
+
+    # never overwrite: clashing names get " (1)", " (2)", ...
+    img_files = [os.path.basename(path) for path, *_ in sources if path not in skip]
+    names = assign_names(img_files, os.listdir(dest))
+
+    links = {}
+    if dedupe_mode == "link":
+        for f, original in duplicates.items():
+            if f in skip:
+                continue
+            if os.path.dirname(original) == src:
+                # duplicate of another file in this batch: link to its new copy
+                original = os.path.join(dest, names[os.path.basename(original)])
+            links[f] = original
+
+    plan.update(img_files=img_files, names=names, links=links,
+                duplicates={os.path.basename(f): original for f, original in duplicates.items()})
+    return plan
+
+def start_transfer(plan, action_func, action_name):
+    global transfer
+    src, dest, img_files, names, links = plan["src"], plan["dest"], plan["img_files"], plan["names"], plan["links"]
+    if not plan["found"]:
+        message_label.config(text=f"ℹ No {EXT_LABEL} files found in source!", fg="blue")
+        return
 
-    img_files = [f for f in os.listdir(src) if f.strip().lower().endswith(('.jpg', '.png'))]
+    def action(src_file, dest_file):
+        if src_file in links:
+            return link_or_copy(links[src_file], src_file, dest_file)
+        return action_func(src_file, dest_file)
 
+    dedupe = (plan["dedupe_mode"], plan["duplicates"])
     if not img_files:
-        message_label.config(text=f"ℹ No JPG/PNG files found in source!", fg="blue")
+        log_action([], src, dest, action_name)
+        log_duplicates(*dedupe)
+        message_label.config(text=f"ℹ All {plan['found']} files are already in the destination.", fg="blue")
         return
 
-    total_files = len(img_files)
-    processed_count = 0
-    jpg_count = 0
-    png_count = 0
+    try:
+        workers = max(1, workers_var.get())
+    except tk.TclError:
+        workers = DEFAULT_WORKERS
+    jobs = [(os.path.join(src, f), os.path.join(dest, names[f]),
+             f if names[f] == f else f"{f} -> {names[f]}") for f in img_files]
+    transfer = TransferEngine(action, jobs, workers=workers)
     progress_bar["value"] = 0
-    window.update_idletasks()
+    set_transfer_buttons(True)
+    transfer.start()
+    window.after(POLL_MS, poll_transfer, src, dest, action_name, dedupe)
 
-    for i, file in enumerate(img_files, start=1):
-        src_file = os.path.join(src, file)
-        dest_file = os.path.join(dest, file)
+# -----------------------------
+# Catalog jobs (scans, duplicate checks, deletes)
+# -----------------------------
+# These can take minutes on a big archive, so they run on a worker thread
+# with their own ImageCatalog connection, like transfers run on the engine.
+# work(catalog, events, *args) reports with events.put(("status", text));
+# its result is handed to on_done(result) on the Tk thread.
+def start_catalog_job(work, on_done, *args):
+    global job
+    events = job = queue.Queue()
+
+    def run():
+        catalog = ImageCatalog()
         try:
-            action_func(src_file, dest_file)
-            processed_count += 1
-            if file.lower().endswith('.jpg'):
-                jpg_count += 1
-            else:
-                png_count += 1
-            message_label.config(text=f"{action_name}: {file}", fg="green")
-            window.update_idletasks()
-            time.sleep(0.05)
+            events.put(("done", work(catalog, events, *args)))
         except Exception as e:
-            message_label.config(text=f"Error {action_name.lower()} {file}: {e}", fg="red")
-        progress_bar["value"] = (i / total_files) * 100
-        window.update_idletasks()
+            events.put(("failed", str(e)))
+        finally:
+            catalog.close()
+
+    move_button["state"] = "disabled"
+    copy_button["state"] = "disabled"
+    threading.Thread(target=run, name="catalog-job", daemon=True).start()
+    window.after(POLL_MS, poll_catalog_job, on_done)
+
+def poll_catalog_job(on_done):
+    global job
+    try:
+        while True:
+            event = job.get_nowait()
+            if event[0] == "status":
+                message_label.config(text=event[1], fg="blue")
+                continue
+            job = None
+            move_button["state"] = "normal"
+            copy_button["state"] = "normal"
+            if event[0] == "failed":
+                message_label.config(text=f"Error: {event[1]}", fg="red")
+            else:
+                on_done(event[1])
+            return
+    except queue.Empty:
+        pass
+    window.after(POLL_MS, poll_catalog_job, on_done)
 
-    message_label.config(text=f"✅ {processed_count}/{total_files} files {action_name.lower()}!", fg="green")
-    log_action(img_files, src, dest, action_name)
+# -----------------------------
+# Transfer progress (runs on the Tk thread)
+# -----------------------------
+def poll_transfer(src, dest, action_name, dedupe):
+    global transfer
+    finished = None
+    try:
+        while True:
+            event = transfer.events.get_nowait()
+            if event[0] == "progress":
+                _, done, failed, total, name = event
+                progress_bar["value"] = (done + failed) / total * 100
+                if name:
+                    message_label.config(text=f"{action_name}: {name}", fg="green")
+            elif event[0] == "error":
+                _, name, error = event
+                message_label.config(text=f"Error {action_name.lower()} {name}: {error}", fg="red")
+            elif event[0] == "done":
+                finished = event
+    except queue.Empty:
+        pass
+    if finished is None:
+        window.after(POLL_MS, poll_transfer, src, dest, action_name, dedupe)
+        return
+    transfer = None
+    set_transfer_buttons(False)
+    finish_transfer(src, dest, action_name, dedupe, *finished[1:])
+
+def finish_transfer(src, dest, action_name, dedupe, done_names, failed, total_files, cancelled):
+    processed_count = len(done_names)
+    jpg_count = sum(1 for f in done_names if f.strip().lower().endswith(('.jpg', '.jpeg')))
+    png_count = sum(1 for f in done_names if f.strip().lower().endswith('.png'))
+    other_count = processed_count - jpg_count - png_count
+    dedupe_mode, duplicates = dedupe
+    dupes_text = f" {len(duplicates)} duplicates {DEDUPE_DONE[dedupe_mode]}." if duplicates else ""
+    if cancelled:
+        message_label.config(text=f"⏹ Cancelled: {processed_count}/{total_files} files {action_name.lower()}.{dupes_text}", fg="blue")
+    else:
+        message_label.config(text=f"✅ {processed_count}/{total_files} files {action_name.lower()}!{dupes_text}", fg="green")
+    log_action(done_names, src, dest, action_name)
+    log_duplicates(dedupe_mode, duplicates)
 
     # Enable buttons dynamically
     open_button["state"] = "normal"
@@ -88,8 +241,34 @@ def process_images(action_func, action_name):
 
     last_moved_types["jpg"] = jpg_count
     last_moved_types["png"] = png_count
+    last_moved_types["other"] = other_count
 
-    plot_moved_graph(jpg_count, png_count)
+    plot_moved_graph(jpg_count, png_count, other_count)
+
+# -----------------------------
+# Pause / cancel
+# -----------------------------
+def set_transfer_buttons(running):
+    move_button["state"] = "disabled" if running else "normal"
+    copy_button["state"] = "disabled" if running else "normal"
+    pause_button["state"] = "normal" if running else "disabled"
+    cancel_button["state"] = "normal" if running else "disabled"
+    pause_button.config(text="Pause")
+
+def toggle_pause():
+    if transfer is None:
+        return
+    if transfer.paused:
+        transfer.resume()
+        pause_button.config(text="Pause")
+    else:
+        transfer.pause()
+        pause_button.config(text="Resume")
+        message_label.config(text="⏸ Paused", fg="blue")
+
+def cancel_transfer():
+    if transfer is not None:
+        transfer.cancel()
 
 # -----------------------------
 # Log action to file
@@ -101,6 +280,13 @@ def log_action(files, src, dest, action_name):
         for f in files:
             log.write(f"[{action_name}] {f}\n")
 
+def log_duplicates(dedupe_mode, duplicates):
+    if not duplicates:
+        return
+    with open("operation_log.txt", "a") as log:
+        for name, original in duplicates.items():
+            log.write(f"[Duplicate {DEDUPE_DONE[dedupe_mode]}] {name} = {original}\n")
+
 # -----------------------------
 # Display Log
 # -----------------------------
@@ -118,70 +304,81 @@ def display_log():
         messagebox.showinfo("Log", "No log file found.")
 
 # -----------------------------
-# Delete JPG/PNG files recursively with pie chart
+# Delete image files recursively with pie chart
 # -----------------------------
 def delete_images_recursive():
+    if transfer is not None or job is not None:
+        return
     folder = filedialog.askdirectory(title="Select Folder to Delete Images Recursively")
     if not folder:
         return
-
+    message_label.config(text=f"🔍 Counting images in {folder}...", fg="blue")
+    start_catalog_job(count_images, confirm_delete, folder)
+
+def count_images(catalog, events, folder):
+    # unchanged subfolders are taken from the catalog instead of being listed again
+    catalog.refresh(folder)
+    return folder, catalog.count(folder, EXTENSIONS)
+
+def confirm_delete(result):
+    folder, found = result
+    if not found:
+        message_label.config(text=f"ℹ No {EXT_LABEL} files found in {folder}", fg="blue")
+        return
     confirm = messagebox.askyesno(
         "Confirm Delete",
-        f"Are you sure you want to delete ALL JPG/PNG files from this folder and all subfolders?\n{folder}"
+        f"Are you sure you want to delete ALL {found} {EXT_LABEL} files from this folder and all subfolders?\n{folder}"
     )
     if confirm:
-        count_deleted = 0
-        count_failed = 0
-        total_before = 0
-        all_files = []
-
-        # Count all JPG/PNG files recursively
-        for root, dirs, files in os.walk(folder):
-            for f in files:
-                if f.strip().lower().endswith(('.jpg', '.png')):
-                    total_before += 1
-                    all_files.append(os.path.join(root, f))
-
-        # Delete files
-        for file_path in all_files:
+        message_label.config(text=f"🗑 Deleting {found} images...", fg="red")
+        start_catalog_job(delete_images, show_delete_summary, folder)
+
+def delete_images(catalog, events, folder):
+    # runs on the job thread: the files counted above, read from the catalog
+    count_deleted = 0
+    count_failed = 0
+
+    # Delete and log images as they are read from the catalog, without holding the list
+    with open("operation_log.txt", "a") as log:
+        log.write(f"\n--- Delete Operation at {datetime.now()} ---\n")
+        log.write(f"Folder: {folder}\n")
+        for path, *_ in catalog.iter_files(folder, EXTENSIONS):
             try:
-                os.remove(file_path)
+                os.remove(path)
                 count_deleted += 1
             except Exception as e:
                 count_failed += 1
+            log.write(f"[Deleted] {path}\n")
+    return count_deleted, count_failed
+
+def show_delete_summary(result):
+    count_deleted, count_failed = result
+    total_before = count_deleted + count_failed
+    remaining = total_before - count_deleted
+    message_label.config(
+        text=f"🗑 Deleted {count_deleted} images. Remaining: {remaining}. Failed: {count_failed}",
+        fg="red"
+    )
 
-        remaining = total_before - count_deleted
-        message_label.config(
-            text=f"🗑 Deleted {count_deleted} images. Remaining: {remaining}. Failed: {count_failed}",
-            fg="red"
-        )
-
-        # Log deleted files
-        with open("operation_log.txt", "a") as log:
-            log.write(f"\n--- Delete Operation at {datetime.now()} ---\n")
-            log.write(f"Folder: {folder}\n")
-            for f in all_files:
-                log.write(f"[Deleted] {f}\n")
-
-        # Show pie chart
-        if total_before > 0:
-            labels = ['Deleted', 'Remaining']
-            sizes = [count_deleted, remaining]
-            colors = ['#f44336', '#4caf50']
-            plt.figure("Delete Summary")
-            plt.pie(sizes, labels=labels, colors=colors, autopct='%1.0f%%', startangle=90)
-            plt.title("Deleted vs Remaining Images")
-            plt.show()
+    # Show pie chart
+    if total_before > 0:
+        labels = ['Deleted', 'Remaining']
+        sizes = [count_deleted, remaining]
+        colors = ['#f44336', '#4caf50']
+        plt.figure("Delete Summary")
+        plt.pie(sizes, labels=labels, colors=colors, autopct='%1.0f%%', startangle=90)
+        plt.title("Deleted vs Remaining Images")
+        plt.show()
 # -----------------------------
 # Graph of last moved/copied images
 # -----------------------------
-def plot_moved_graph(jpg_count, png_count):
-    if jpg_count == 0 and png_count == 0:
+def plot_moved_graph(jpg_count, png_count, other_count=0):
+    if jpg_count == 0 and png_count == 0 and other_count == 0:
         messagebox.showinfo("Graph", "No files moved or copied yet.")
         return
-    labels = ['JPG', 'PNG']
-    sizes = [jpg_count, png_count]
-    colors = ['#4caf50', '#2196f3']
+    labels = ['JPG', 'PNG', 'Other']
+    sizes = [jpg_count, png_count, other_count]
+    colors = ['#4caf50', '#2196f3', '#ff9800']
     plt.figure("Files Summary")
     plt.bar(labels, sizes, color=colors)
     plt.title("Number of Files Moved/Copied by Type")
@@ -191,11 +388,11 @@ def show_user_manual():
     manual_text = """
 🖼 Interactive Image Manager — User Manual
 
-1. Select Source Folder: Folder containing JPG/PNG images.
+1. Select Source Folder: Folder containing images (JPG, JPEG, PNG, WEBP, HEIC).
 2. Select Destination Folder: Folder where images will be moved/copied.
 3. Move Images: Moves images from source to destination.
 4. Copy Images: Copies images without removing from source.
-5. Delete JPG/PNG from Folder: Deletes all images from selected folder and subfolders.
+5. Delete Images from Folder: Deletes all images from selected folder and subfolders.
 6. Display Log: Shows operation log (Move, Copy, Delete).
 7. Show Graph of Files: Displays a bar chart of last moved/copied files.
 8. Open Destination Folder: Opens destination folder in Explorer.
@@ -203,6 +400,10 @@ def show_user_manual():
 10. Exit: Closes the application.
 
 ✅ Note: Always check the progress bar and messages for operation status.
+   Pause/Cancel stop a running move or copy; 'Workers' sets how many files are transferred at once.
+   Folders are remembered in image_catalog.sqlite, so only folders that changed are scanned again.
+   'Duplicates' (Copy only): skip images already in the destination, hard-link them, or just report
+   them. Files are never overwritten: a clashing name is copied as 'name (1).jpg'.
 """
     manual_window = tk.Toplevel(window)
     manual_window.title("User Manual")
@@ -290,8 +491,20 @@ tk.Entry(frame2, textvariable=dest_path, width=60).grid(row=0, column=1, padx=5)
 ttk.Button(frame2, text="Browse", command=browse_destination).grid(row=0, column=2, padx=5)
 
 # Progress bar
-progress_bar = ttk.Progressbar(window, orient="horizontal", length=550, mode="determinate")
-progress_bar.pack(pady=20)
+progress_frame = tk.Frame(window, bg="#f0f8ff")
+progress_frame.pack(pady=20)
+progress_bar = ttk.Progressbar(progress_frame, orient="horizontal", length=550, mode="determinate")
+progress_bar.grid(row=0, column=0, padx=5)
+pause_button = ttk.Button(progress_frame, text="Pause", command=toggle_pause, state="disabled")
+pause_button.grid(row=0, column=1, padx=5)
+cancel_button = ttk.Button(progress_frame, text="Cancel", command=cancel_transfer, state="disabled")
+cancel_button.grid(row=0, column=2, padx=5)
+tk.Label(progress_frame, text="Workers:", bg="#f0f8ff").grid(row=0, column=3, padx=5)
+workers_var = tk.IntVar(value=DEFAULT_WORKERS)
+ttk.Spinbox(progress_frame, from_=1, to=64, textvariable=workers_var, width=4).grid(row=0, column=4, padx=5)
+tk.Label(progress_frame, text="Duplicates:", bg="#f0f8ff").grid(row=0, column=5, padx=5)
+dedupe_var = tk.StringVar(value="off")
+ttk.Combobox(progress_frame, values=DEDUPE_MODES, textvariable=dedupe_var, state="readonly", width=7).grid(row=0, column=6, padx=5)
 
 # Animated message
 message_label = tk.Label(window, text="", font=("Segoe UI", 12), bg="#f0f8ff", fg="green")
@@ -301,17 +514,20 @@ message_label.pack(pady=5)
 button_frame = tk.Frame(window, bg="#f0f8ff")
 button_frame.pack(pady=10)
 
-ttk.Button(button_frame, text="Move Images", command=move_image_files).grid(row=0, column=0, padx=10)
-ttk.Button(button_frame, text="Copy Images", command=copy_image_files).grid(row=0, column=1, padx=10)
+move_button = ttk.Button(button_frame, text="Move Images", command=move_image_files)
+move_button.grid(row=0, column=0, padx=10)
+copy_button = ttk.Button(button_frame, text="Copy Images", command=copy_image_files)
+copy_button.grid(row=0, column=1, padx=10)
 open_button = ttk.Button(button_frame, text="Open Destination Folder", command=open_destination, state="disabled")
 open_button.grid(row=0, column=2, padx=10)
 display_log_button = ttk.Button(button_frame, text="Display Log", command=display_log, state="disabled")
 display_log_button.grid(row=0, column=3, padx=10)
-delete_button = ttk.Button(button_frame, text="Delete JPG/PNG from Folder", command=delete_images_recursive, state="disabled")
+delete_button = ttk.Button(button_frame, text="Delete Images from Folder", command=delete_images_recursive, state="disabled")
 delete_button.grid(row=0, column=4, padx=10)
 graph_button = ttk.Button(button_frame, text="Show Graph of Files",
                           command=lambda: plot_moved_graph(last_moved_types.get("jpg", 0),
-                                                          last_moved_types.get("png", 0)),
+                                                          last_moved_types.get("png", 0),
+                                                          last_moved_types.get("other", 0)),
                           state="disabled")
 graph_button.grid(row=0, column=5, padx=10)
 ttk.Button(button_frame, text="Clear Log", command=clear_log).grid(row=0, column=6, padx=10)